@@ -1,15 +1,41 @@
-from flask import Blueprint, render_template, request, redirect, url_for, abort
+from flask import (
+    Blueprint, Response, render_template, request, redirect, url_for, abort,
+    current_app, stream_with_context,
+)
 from flask_login import login_required, current_user
 from sqlalchemy import func
-from datetime import datetime, date
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from datetime import datetime, date, timedelta
+import csv
+import io
 
 from models import (
     db,
+    Branch,
     Batch,
     Admission,
     FeePayment,
     PaymentSource,
     BatchPaymentSource,
+    PaymentSourceTemplate,
+    PaymentSourceTemplateItem,
+    EmailOutbox,
+    BatchInstallment,
+    AdmissionInstallment,
+    AdmissionDuesAging,
+    DailyCollection,
+    AuditLog,
+    StatementUpload,
+    StatementLine,
+    ReconciliationMatch,
+)
+import audit
+from dues_aging import BUCKETS
+from receipt_pdf import iter_receipt_zip, pdf_available
+from reconciliation import (
+    AMBIGUOUS, MAX_TOLERANCE_DAYS, UNMATCHED,
+    StatementError, read_statement, reconcile,
 )
 
 admin_bp = Blueprint("admin", __name__, url_prefix="/admin")
@@ -122,6 +148,10 @@ def manage_payment_sources():
         )
         db.session.add(ps)
         db.session.commit()
+        audit.record(
+            "payment_source_created", "payment_source", ps.id,
+            after=audit.snapshot(ps),
+        )
 
     payment_sources = PaymentSource.query.all()
     return render_template(
@@ -150,24 +180,20 @@ def assign_payment_sources():
         if not payment_source_ids:
             abort(400, "At least one payment source is required")
 
-        batch_id = int(batch_id)
+        batch_id = resolve_batch_ids([batch_id])[0]
+        payment_source_ids = resolve_payment_source_ids(payment_source_ids)
 
-        # Remove old config
-        BatchPaymentSource.query.filter_by(
-            batch_id=batch_id
-        ).delete()
+        before = batch_source_lists([batch_id])
 
         # Normalize order → priority = index
-        for priority, ps_id in enumerate(payment_source_ids):
-            db.session.add(
-                BatchPaymentSource(
-                    batch_id=batch_id,
-                    payment_source_id=int(ps_id),
-                    priority=priority,
-                )
-            )
+        sync_batch_payment_sources([batch_id], payment_source_ids)
 
         db.session.commit()
+        audit.record(
+            "payment_sources_assigned", "batch", batch_id,
+            before={"payment_source_ids": before.get(batch_id, [])},
+            after={"payment_source_ids": payment_source_ids},
+        )
         return redirect(url_for("admin.assign_payment_sources"))
 
     batches = Batch.query.order_by(Batch.batch_code).all()
@@ -188,6 +214,224 @@ def assign_payment_sources():
     )
 
 
+def resolve_batch_ids(batch_ids):
+    """
+    Posted batch ids as ints, aborting unless every one is a batch the
+    admin can see. BatchPaymentSource has no branch of its own, so this
+    Batch lookup is what keeps branch admins to their own batches.
+    """
+    try:
+        batch_ids = list(dict.fromkeys(int(b_id) for b_id in batch_ids))
+    except ValueError:
+        abort(400, "Invalid batch id")
+
+    found = {
+        b_id for (b_id,) in db.session.query(Batch.id).filter(
+            Batch.id.in_(batch_ids)
+        )
+    }
+    missing = [b_id for b_id in batch_ids if b_id not in found]
+    if missing:
+        abort(400, f"Unknown batch: {', '.join(map(str, missing))}")
+
+    return batch_ids
+
+
+def resolve_payment_source_ids(payment_source_ids):
+    """Posted payment source ids as ints, in order, aborting on unknown ids."""
+    try:
+        payment_source_ids = list(
+            dict.fromkeys(int(ps_id) for ps_id in payment_source_ids)
+        )
+    except ValueError:
+        abort(400, "Invalid payment source id")
+
+    known_sources = {
+        ps_id for (ps_id,) in db.session.query(PaymentSource.id).filter(
+            PaymentSource.id.in_(payment_source_ids)
+        )
+    }
+    if known_sources != set(payment_source_ids):
+        abort(400, "Unknown payment source")
+
+    return payment_source_ids
+
+
+def batch_source_lists(batch_ids):
+    """Current payment source ids per batch, in priority order."""
+    lists = {}
+    rows = BatchPaymentSource.query.filter(
+        BatchPaymentSource.batch_id.in_(batch_ids)
+    ).order_by(
+        BatchPaymentSource.batch_id,
+        BatchPaymentSource.priority,
+    ).all()
+    for row in rows:
+        lists.setdefault(row.batch_id, []).append(row.payment_source_id)
+    return lists
+
+
+def sync_batch_payment_sources(batch_ids, payment_source_ids):
+    """
+    Make every batch in batch_ids use payment_source_ids (in priority order).
+
+    Existing mappings are diffed against the desired list, so only rows
+    that actually change are inserted, updated or deleted. The caller
+    commits. Returns (inserted, updated, deleted).
+    """
+    desired = {}
+    for priority, ps_id in enumerate(payment_source_ids):
+        desired.setdefault(ps_id, priority)
+
+    existing = {}
+    rows = BatchPaymentSource.query.filter(
+        BatchPaymentSource.batch_id.in_(batch_ids)
+    ).all()
+    for row in rows:
+        existing.setdefault(row.batch_id, []).append(row)
+
+    inserted = updated = deleted = 0
+
+    for batch_id in batch_ids:
+        seen = set()
+
+        for row in existing.get(batch_id, []):
+            ps_id = row.payment_source_id
+
+            if ps_id not in desired or ps_id in seen:
+                db.session.delete(row)
+                deleted += 1
+                continue
+
+            seen.add(ps_id)
+            if row.priority != desired[ps_id]:
+                row.priority = desired[ps_id]
+                updated += 1
+
+        for ps_id, priority in desired.items():
+            if ps_id not in seen:
+                db.session.add(
+                    BatchPaymentSource(
+                        batch_id=batch_id,
+                        payment_source_id=ps_id,
+                        priority=priority,
+                    )
+                )
+                inserted += 1
+
+    return inserted, updated, deleted
+
+
+# -------------------------------------------------
+# PAYMENT SOURCE TEMPLATES (BULK CONFIG)
+# -------------------------------------------------
+@admin_bp.route("/payment-templates", methods=["GET", "POST"])
+@login_required
+def payment_templates():
+    if current_user.role != "admin":
+        abort(403)
+
+    message = ""
+
+    if request.method == "POST":
+        action = request.form.get("action")
+
+        if action == "create":
+            name = request.form.get("name")
+            payment_source_ids = request.form.getlist("payment_sources")
+
+            if not name:
+                abort(400, "Template name is required")
+
+            if not payment_source_ids:
+                abort(400, "At least one payment source is required")
+
+            if PaymentSourceTemplate.query.filter_by(name=name).first():
+                abort(400, "Template name already exists")
+
+            payment_source_ids = resolve_payment_source_ids(
+                payment_source_ids
+            )
+
+            template = PaymentSourceTemplate(name=name)
+            for priority, ps_id in enumerate(payment_source_ids):
+                template.items.append(
+                    PaymentSourceTemplateItem(
+                        payment_source_id=ps_id,
+                        priority=priority,
+                    )
+                )
+            db.session.add(template)
+            db.session.commit()
+            audit.record(
+                "payment_template_created", "payment_template", template.id,
+                after={
+                    "name": template.name,
+                    "payment_source_ids": [
+                        item.payment_source_id for item in template.items
+                    ],
+                },
+            )
+
+            message = f"Template '{name}' created."
+
+        elif action == "apply":
+            template_id = request.form.get("template_id")
+            batch_ids = request.form.getlist("batch_ids")
+
+            if not template_id:
+                abort(400, "Template is required")
+
+            if not batch_ids:
+                abort(400, "Select at least one batch")
+
+            template = PaymentSourceTemplate.query.get_or_404(
+                int(template_id)
+            )
+
+            batch_ids = resolve_batch_ids(batch_ids)
+            source_ids = [item.payment_source_id for item in template.items]
+            before = batch_source_lists(batch_ids)
+
+            # One transaction for all selected batches
+            inserted, updated, deleted = sync_batch_payment_sources(
+                batch_ids, source_ids
+            )
+            db.session.commit()
+
+            for b_id in batch_ids:
+                if before.get(b_id, []) != source_ids:
+                    audit.record(
+                        "payment_template_applied", "batch", b_id,
+                        before={"payment_source_ids": before.get(b_id, [])},
+                        after={
+                            "payment_source_ids": source_ids,
+                            "template_id": template.id,
+                        },
+                    )
+
+            message = (
+                f"Applied '{template.name}' to {len(batch_ids)} batches "
+                f"({inserted} added, {updated} reordered, {deleted} removed)."
+            )
+
+    templates = PaymentSourceTemplate.query.order_by(
+        PaymentSourceTemplate.name
+    ).all()
+    batches = Batch.query.order_by(Batch.batch_code).all()
+    payment_sources = PaymentSource.query.filter_by(
+        is_active=True
+    ).order_by(PaymentSource.name).all()
+
+    return render_template(
+        "admin_payment_templates.html",
+        templates=templates,
+        batches=batches,
+        payment_sources=payment_sources,
+        message=message,
+    )
+
+
 # -------------------------------------------------
 # BATCH MANAGEMENT
 # -------------------------------------------------
@@ -198,8 +442,24 @@ def manage_batches():
         abort(403)
 
     if request.method == "POST":
+        # Branch admins always create in their own branch; head office
+        # picks one
+        branch_id = current_user.branch_id
+        if branch_id is None:
+            branch_id = request.form.get("branch_id", type=int)
+            if branch_id is not None and not db.session.get(Branch, branch_id):
+                abort(400, "Unknown branch")
+
+        batch_code = request.form.get("batch_code")
+
+        # Batch codes are unique across all branches
+        if Batch.query.filter_by(batch_code=batch_code).execution_options(
+            all_branches=True
+        ).first():
+            abort(400, f"Batch code {batch_code} already exists")
+
         new_batch = Batch(
-            batch_code=request.form.get("batch_code"),
+            batch_code=batch_code,
             course_name=request.form.get("course_name"),
             total_fee=int(request.form.get("total_fee")),
             start_date=datetime.strptime(
@@ -211,16 +471,216 @@ def manage_batches():
             if request.form.get("end_date")
             else None,
             status="Active",
+            branch_id=branch_id,
         )
         db.session.add(new_batch)
         db.session.commit()
+        audit.record(
+            "batch_created", "batch", new_batch.id,
+            after=audit.snapshot(new_batch), branch_id=new_batch.branch_id,
+        )
 
     batches = Batch.query.order_by(
         Batch.created_at.desc()
     ).all()
+    branches = (
+        Branch.query.order_by(Branch.name).all()
+        if current_user.branch_id is None
+        else []
+    )
     return render_template(
         "admin_batches.html",
-        batches=batches
+        batches=batches,
+        branches=branches,
+    )
+
+
+# -------------------------------------------------
+# INSTALLMENT PLAN PER BATCH
+# -------------------------------------------------
+@admin_bp.route("/batches/<int:batch_id>/installments", methods=["GET", "POST"])
+@login_required
+def batch_installments(batch_id):
+    if current_user.role != "admin":
+        abort(403)
+
+    batch = Batch.query.get_or_404(batch_id)
+    error = ""
+
+    if request.method == "POST":
+        amounts = request.form.getlist("amount")
+        due_days = request.form.getlist("due_after_days")
+
+        try:
+            plan = [
+                (int(amount), int(days or 0))
+                for amount, days in zip(amounts, due_days)
+                if amount
+            ]
+        except ValueError:
+            plan = None
+
+        if plan is None:
+            error = "Amounts and days must be whole numbers."
+        elif any(amount <= 0 or days < 0 for amount, days in plan):
+            error = "Amounts must be positive and days cannot be negative."
+        elif sum(amount for amount, _ in plan) != batch.total_fee:
+            error = f"Installments must add up to the batch fee (₹{batch.total_fee})."
+        else:
+            before = [
+                [item.amount, item.due_after_days]
+                for item in BatchInstallment.query.filter_by(
+                    batch_id=batch.id
+                ).order_by(BatchInstallment.sequence)
+            ]
+
+            # Applies to future admissions only
+            BatchInstallment.query.filter_by(batch_id=batch.id).delete()
+            for sequence, (amount, days) in enumerate(plan, start=1):
+                db.session.add(
+                    BatchInstallment(
+                        batch_id=batch.id,
+                        sequence=sequence,
+                        due_after_days=days,
+                        amount=amount,
+                    )
+                )
+            db.session.commit()
+            audit.record(
+                "installment_plan_saved", "batch", batch.id,
+                before={"installments": before},
+                after={"installments": [list(item) for item in plan]},
+                branch_id=batch.branch_id,
+            )
+            return redirect(url_for("admin.manage_batches"))
+
+    plan = BatchInstallment.query.filter_by(
+        batch_id=batch.id
+    ).order_by(BatchInstallment.sequence).all()
+
+    return render_template(
+        "admin_batch_installments.html",
+        batch=batch,
+        plan=plan,
+        error=error,
+    )
+
+
+# -------------------------------------------------
+# CLONE BATCHES (NEW TERM)
+# -------------------------------------------------
+@admin_bp.route("/batches/clone", methods=["GET", "POST"])
+@login_required
+def clone_batches():
+    if current_user.role != "admin":
+        abort(403)
+
+    message = ""
+
+    if request.method == "POST":
+        batch_ids = request.form.getlist("batch_ids")
+        find_text = request.form.get("code_find", "")
+        replace_text = request.form.get("code_replace", "")
+        suffix = request.form.get("code_suffix", "")
+        copy_sources = request.form.get("copy_sources") == "1"
+
+        if not batch_ids:
+            abort(400, "Select at least one batch")
+
+        if not request.form.get("start_date"):
+            abort(400, "New start date is required")
+
+        new_start = datetime.strptime(
+            request.form.get("start_date"), "%Y-%m-%d"
+        ).date()
+
+        sources = Batch.query.filter(
+            Batch.id.in_(resolve_batch_ids(batch_ids))
+        ).order_by(Batch.start_date, Batch.batch_code).all()
+
+        if not sources:
+            abort(404)
+
+        # Earliest batch moves to the new start date, the rest keep
+        # their relative offsets
+        shift = new_start - sources[0].start_date
+
+        new_codes = {}
+        for batch in sources:
+            code = batch.batch_code
+            if find_text:
+                code = code.replace(find_text, replace_text)
+            new_codes[batch.id] = code + suffix
+
+        codes = list(new_codes.values())
+        if len(set(codes)) != len(codes):
+            abort(400, "New batch codes are not unique")
+
+        # Batch codes are unique across all branches
+        clash = Batch.query.filter(
+            Batch.batch_code.in_(codes)
+        ).execution_options(all_branches=True).first()
+        if clash:
+            abort(400, f"Batch code {clash.batch_code} already exists")
+
+        clones = {}
+        for batch in sources:
+            clones[batch.id] = Batch(
+                batch_code=new_codes[batch.id],
+                course_name=batch.course_name,
+                total_fee=batch.total_fee,
+                start_date=batch.start_date + shift,
+                end_date=batch.end_date + shift if batch.end_date else None,
+                status="Active",
+                branch_id=batch.branch_id,
+            )
+        db.session.add_all(clones.values())
+        db.session.flush()
+
+        plans = BatchInstallment.query.filter(
+            BatchInstallment.batch_id.in_(clones.keys())
+        ).all()
+        db.session.add_all(
+            BatchInstallment(
+                batch_id=clones[item.batch_id].id,
+                sequence=item.sequence,
+                due_after_days=item.due_after_days,
+                amount=item.amount,
+            )
+            for item in plans
+        )
+
+        if copy_sources:
+            mappings = BatchPaymentSource.query.filter(
+                BatchPaymentSource.batch_id.in_(clones.keys())
+            ).all()
+            db.session.add_all(
+                BatchPaymentSource(
+                    batch_id=clones[m.batch_id].id,
+                    payment_source_id=m.payment_source_id,
+                    priority=m.priority,
+                )
+                for m in mappings
+            )
+
+        db.session.commit()
+
+        for source_id, clone in clones.items():
+            audit.record(
+                "batch_cloned", "batch", clone.id,
+                after={**audit.snapshot(clone), "cloned_from": source_id},
+                branch_id=clone.branch_id,
+            )
+
+        message = f"Cloned {len(clones)} batches."
+
+    batches = Batch.query.order_by(
+        Batch.start_date.desc(), Batch.batch_code
+    ).all()
+    return render_template(
+        "admin_batch_clone.html",
+        batches=batches,
+        message=message,
     )
 
 
@@ -269,10 +729,13 @@ def delete_batch(batch_id):
     batch = Batch.query.get_or_404(batch_id)
 
     # HARD SAFETY: delete dependent records first
-    # 1. Remove batch-payment mappings
+    # 1. Remove batch-payment mappings and installment plan
     BatchPaymentSource.query.filter_by(
         batch_id=batch.id
     ).delete()
+    BatchInstallment.query.filter_by(
+        batch_id=batch.id
+    ).delete()
 
     # 2. Get admissions linked to this batch
     admissions = Admission.query.filter_by(
@@ -281,8 +744,81 @@ def delete_batch(batch_id):
 
     admission_ids = [a.id for a in admissions]
 
-    # 3. Delete fee payments linked to those admissions
+    payments = FeePayment.query.filter(
+        FeePayment.admission_id.in_(admission_ids)
+    ).order_by(FeePayment.id).all()
+
+    # Deleting payments is a money movement: audit every deleted row in
+    # this transaction, one entry each
+    for payment in payments:
+        audit.record(
+            "payment_deleted", "fee_payment", payment.id,
+            before=audit.snapshot(payment),
+            branch_id=payment.branch_id, transactional=True,
+        )
+    for admission in admissions:
+        audit.record(
+            "admission_deleted", "admission", admission.id,
+            before=audit.snapshot(admission),
+            branch_id=admission.branch_id, transactional=True,
+        )
+    audit.record(
+        "batch_deleted", "batch", batch.id,
+        before={
+            **audit.snapshot(batch),
+            "admission_ids": admission_ids,
+            "payment_count": len(payments),
+            "payment_total": sum(payment.amount for payment in payments),
+        },
+        branch_id=batch.branch_id,
+        transactional=True,
+    )
+
+    # 3. Delete installments, aging rows, fee payments (and queued receipts)
     if admission_ids:
+        AdmissionInstallment.query.filter(
+            AdmissionInstallment.admission_id.in_(admission_ids)
+        ).delete(synchronize_session=False)
+        AdmissionDuesAging.query.filter(
+            AdmissionDuesAging.admission_id.in_(admission_ids)
+        ).delete(synchronize_session=False)
+        DailyCollection.query.filter_by(
+            batch_id=batch.id
+        ).delete(synchronize_session=False)
+
+        payment_ids = db.session.query(FeePayment.id).filter(
+            FeePayment.admission_id.in_(admission_ids)
+        )
+        EmailOutbox.query.filter(
+            EmailOutbox.fee_payment_id.in_(payment_ids)
+        ).delete(synchronize_session=False)
+
+        # Statement lines these payments settled go back to unmatched
+        matched_line_ids = db.session.query(
+            ReconciliationMatch.statement_line_id
+        ).filter(ReconciliationMatch.fee_payment_id.in_(payment_ids))
+        released = (
+            db.session.query(ReconciliationMatch.upload_id, func.count())
+            .filter(ReconciliationMatch.fee_payment_id.in_(payment_ids))
+            .group_by(ReconciliationMatch.upload_id)
+            .all()
+        )
+        StatementLine.query.filter(
+            StatementLine.id.in_(matched_line_ids)
+        ).update({"status": UNMATCHED}, synchronize_session=False)
+        ReconciliationMatch.query.filter(
+            ReconciliationMatch.fee_payment_id.in_(payment_ids)
+        ).delete(synchronize_session=False)
+
+        for upload_id, count in released:
+            StatementUpload.query.filter_by(id=upload_id).update(
+                {
+                    "matched_count": StatementUpload.matched_count - count,
+                    "unmatched_count": StatementUpload.unmatched_count + count,
+                },
+                synchronize_session=False,
+            )
+
         FeePayment.query.filter(
             FeePayment.admission_id.in_(admission_ids)
         ).delete(synchronize_session=False)
@@ -360,3 +896,542 @@ def batch_fee_report():
         batch_totals=batch_totals,
         breakdown_map=breakdown_map,
     )
+
+
+# -------------------------------------------------
+# DUES AGING REPORT (SERVED FROM ROLLUP)
+# -------------------------------------------------
+@admin_bp.route("/dues-aging")
+@login_required
+def dues_aging():
+    if current_user.role != "admin":
+        abort(403)
+
+    rows = (
+        db.session.query(
+            AdmissionDuesAging.batch_id,
+            Batch.batch_code,
+            AdmissionDuesAging.course_name,
+            AdmissionDuesAging.bucket,
+            func.count(AdmissionDuesAging.admission_id).label("students"),
+            func.sum(AdmissionDuesAging.pending_amount).label("amount"),
+        )
+        .join(Batch, Batch.id == AdmissionDuesAging.batch_id)
+        .group_by(
+            AdmissionDuesAging.batch_id,
+            Batch.batch_code,
+            AdmissionDuesAging.course_name,
+            AdmissionDuesAging.bucket,
+        )
+        .all()
+    )
+
+    # ---------------------------------------------
+    # Pivot: batch / course x bucket
+    # ---------------------------------------------
+    def empty():
+        return {"buckets": {b: 0 for b in BUCKETS}, "students": 0, "total": 0}
+
+    by_batch = {}
+    by_course = {}
+    overall = empty()
+
+    for row in rows:
+        batch_entry = by_batch.setdefault(row.batch_id, {
+            "batch_id": row.batch_id,
+            "batch_code": row.batch_code,
+            "course_name": row.course_name,
+            **empty(),
+        })
+        course_entry = by_course.setdefault(row.course_name, {
+            "course_name": row.course_name,
+            **empty(),
+        })
+
+        for entry in (batch_entry, course_entry, overall):
+            entry["buckets"][row.bucket] += row.amount
+            entry["students"] += row.students
+            entry["total"] += row.amount
+
+    last_refresh = db.session.query(
+        func.max(AdmissionDuesAging.refreshed_at)
+    ).scalar()
+
+    return render_template(
+        "admin_dues_aging.html",
+        buckets=BUCKETS,
+        by_batch=sorted(by_batch.values(), key=lambda e: e["batch_code"]),
+        by_course=sorted(by_course.values(), key=lambda e: e["course_name"]),
+        overall=overall,
+        last_refresh=last_refresh,
+    )
+
+
+def _aging_students_query():
+    query = (
+        AdmissionDuesAging.query
+        .options(
+            joinedload(AdmissionDuesAging.admission)
+            .joinedload(Admission.student),
+            joinedload(AdmissionDuesAging.batch),
+        )
+    )
+
+    if request.args.get("bucket"):
+        query = query.filter(
+            AdmissionDuesAging.bucket == request.args["bucket"]
+        )
+    if request.args.get("batch_id"):
+        query = query.filter(
+            AdmissionDuesAging.batch_id == request.args.get("batch_id", type=int)
+        )
+    if request.args.get("course"):
+        query = query.filter(
+            AdmissionDuesAging.course_name == request.args["course"]
+        )
+
+    return query.order_by(
+        AdmissionDuesAging.age_days.desc(),
+        AdmissionDuesAging.admission_id,
+    )
+
+
+@admin_bp.route("/dues-aging/students")
+@login_required
+def dues_aging_students():
+    if current_user.role != "admin":
+        abort(403)
+
+    return render_template(
+        "admin_dues_aging_students.html",
+        rows=_aging_students_query().all(),
+        filters=request.args,
+    )
+
+
+@admin_bp.route("/dues-aging/export")
+@login_required
+def dues_aging_export():
+    if current_user.role != "admin":
+        abort(403)
+
+    rows = _aging_students_query().all()
+
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow([
+        "Student ID", "Name", "Mobile", "Batch", "Course",
+        "Pending", "Last Payment", "Age (days)", "Bucket",
+    ])
+    for row in rows:
+        student = row.admission.student
+        writer.writerow([
+            student.student_id,
+            student.name,
+            student.mobile,
+            row.batch.batch_code,
+            row.course_name,
+            row.pending_amount,
+            row.last_payment_date or "",
+            row.age_days,
+            row.bucket,
+        ])
+
+    return Response(
+        out.getvalue(),
+        mimetype="text/csv",
+        headers={
+            "Content-Disposition": "attachment; filename=dues_aging.csv"
+        },
+    )
+
+
+# -------------------------------------------------
+# COLLECTION TRENDS (SERVED FROM DAILY ROLLUP)
+# -------------------------------------------------
+def _period_start(day, granularity):
+    if granularity == "weekly":
+        return day - timedelta(days=day.weekday())
+    if granularity == "monthly":
+        return day.replace(day=1)
+    return day
+
+
+def _shift_years(day, years):
+    try:
+        return day.replace(year=day.year + years)
+    except ValueError:  # 29 Feb
+        return day.replace(year=day.year + years, day=28)
+
+
+@admin_bp.route("/collection-trends")
+@login_required
+def collection_trends():
+    if current_user.role != "admin":
+        abort(403)
+
+    granularity = request.args.get("granularity", "daily")
+    if granularity not in ("daily", "weekly", "monthly"):
+        abort(400)
+
+    default_days = {"daily": 30, "weekly": 12 * 7, "monthly": 365}
+    end = (
+        datetime.strptime(request.args["end"], "%Y-%m-%d").date()
+        if request.args.get("end")
+        else date.today()
+    )
+    start = (
+        datetime.strptime(request.args["start"], "%Y-%m-%d").date()
+        if request.args.get("start")
+        else end - timedelta(days=default_days[granularity] - 1)
+    )
+    batch_id = request.args.get("batch_id", type=int)
+
+    def daily_totals(range_start, range_end):
+        query = (
+            db.session.query(
+                DailyCollection.collection_date,
+                func.sum(DailyCollection.payment_count),
+                func.sum(DailyCollection.amount),
+            )
+            .filter(
+                DailyCollection.collection_date >= range_start,
+                DailyCollection.collection_date <= range_end,
+            )
+        )
+        if batch_id:
+            query = query.filter(DailyCollection.batch_id == batch_id)
+        return query.group_by(DailyCollection.collection_date).all()
+
+    # ---------------------------------------------
+    # Current range + same range last year
+    # ---------------------------------------------
+    periods = {}
+
+    for day, count, amount in daily_totals(start, end):
+        entry = periods.setdefault(
+            _period_start(day, granularity),
+            {"count": 0, "amount": 0, "last_year": 0},
+        )
+        entry["count"] += count
+        entry["amount"] += amount
+
+    last_year = daily_totals(_shift_years(start, -1), _shift_years(end, -1))
+
+    for day, count, amount in last_year:
+        key = _period_start(_shift_years(day, 1), granularity)
+        if key in periods:
+            periods[key]["last_year"] += amount
+        else:
+            periods[key] = {"count": 0, "amount": 0, "last_year": amount}
+
+    trend = [
+        {"period": key, **value}
+        for key, value in sorted(periods.items())
+    ]
+    max_amount = max(
+        [t["amount"] for t in trend] + [t["last_year"] for t in trend] + [1]
+    )
+
+    # ---------------------------------------------
+    # Breakdown by payment source over the range
+    # ---------------------------------------------
+    source_query = (
+        db.session.query(
+            DailyCollection.payment_source_id,
+            func.sum(DailyCollection.payment_count).label("count"),
+            func.sum(DailyCollection.amount).label("amount"),
+        )
+        .filter(
+            DailyCollection.collection_date >= start,
+            DailyCollection.collection_date <= end,
+        )
+    )
+    if batch_id:
+        source_query = source_query.filter(DailyCollection.batch_id == batch_id)
+    source_rows = source_query.group_by(DailyCollection.payment_source_id).all()
+
+    payment_source_map = {ps.id: ps for ps in PaymentSource.query.all()}
+
+    return render_template(
+        "admin_collection_trends.html",
+        granularity=granularity,
+        start=start,
+        end=end,
+        batch_id=batch_id,
+        batches=Batch.query.order_by(Batch.batch_code).all(),
+        trend=trend,
+        max_amount=max_amount,
+        total_amount=sum(t["amount"] for t in trend),
+        total_last_year=sum(t["last_year"] for t in trend),
+        source_rows=source_rows,
+        payment_source_map=payment_source_map,
+    )
+
+
+# -------------------------------------------------
+# RECEIPT BUNDLES (PDF ZIP)
+# -------------------------------------------------
+@admin_bp.route("/receipts")
+@login_required
+def receipt_bundles():
+    if current_user.role != "admin":
+        abort(403)
+
+    return render_template(
+        "admin_receipt_bundles.html",
+        batches=Batch.query.order_by(Batch.batch_code).all(),
+        pdf_available=pdf_available(),
+    )
+
+
+@admin_bp.route("/receipts/bundle.zip")
+@login_required
+def receipt_bundle():
+    if current_user.role != "admin":
+        abort(403)
+
+    if not pdf_available():
+        abort(501, "PDF receipts are not available")
+
+    batch_id = request.args.get("batch_id", type=int)
+    start = request.args.get("start")
+    end = request.args.get("end")
+
+    if not (batch_id or start or end):
+        abort(400, "Choose a batch or a date range")
+
+    query = (
+        FeePayment.query
+        .join(Admission, Admission.id == FeePayment.admission_id)
+        .options(
+            joinedload(FeePayment.admission).joinedload(Admission.student),
+            joinedload(FeePayment.admission).joinedload(Admission.batch),
+        )
+    )
+
+    if batch_id:
+        query = query.filter(Admission.batch_id == batch_id)
+    if start:
+        query = query.filter(
+            FeePayment.payment_date
+            >= datetime.strptime(start, "%Y-%m-%d").date()
+        )
+    if end:
+        query = query.filter(
+            FeePayment.payment_date
+            <= datetime.strptime(end, "%Y-%m-%d").date()
+        )
+
+    def payment_chunks(chunk_size=100):
+        last_id = 0
+        while True:
+            payments = (
+                query.filter(FeePayment.id > last_id)
+                .order_by(FeePayment.id)
+                .limit(chunk_size)
+                .all()
+            )
+            if not payments:
+                return
+            yield payments
+            last_id = payments[-1].id
+
+    return Response(
+        stream_with_context(iter_receipt_zip(payment_chunks())),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": "attachment; filename=receipts.zip"
+        },
+    )
+
+
+# -------------------------------------------------
+# AUDIT LOG
+# -------------------------------------------------
+@admin_bp.route("/audit")
+@login_required
+def audit_log():
+    if current_user.role != "admin":
+        abort(403)
+
+    # Make buffered entries visible before reading
+    audit.flush()
+
+    entity_type = request.args.get("entity_type")
+    entity_id = request.args.get("entity_id", type=int)
+
+    query = AuditLog.query
+    if entity_type:
+        query = query.filter(AuditLog.entity_type == entity_type)
+        if entity_id:
+            query = query.filter(AuditLog.entity_id == entity_id)
+
+    entries = query.order_by(
+        AuditLog.created_at.desc(), AuditLog.id.desc()
+    ).limit(200).all()
+
+    return render_template(
+        "admin_audit_log.html",
+        entries=entries,
+        flush_seconds=current_app.config.get("AUDIT_FLUSH_SECONDS", 10),
+        entity_type=entity_type,
+        entity_id=entity_id,
+    )
+
+
+# -------------------------------------------------
+# STATEMENT RECONCILIATION
+# -------------------------------------------------
+@admin_bp.route("/reconciliation", methods=["GET", "POST"])
+@login_required
+def reconciliation():
+    if current_user.role != "admin":
+        abort(403)
+
+    error = ""
+
+    if request.method == "POST":
+        statement = request.files.get("statement")
+        payment_source_ids = request.form.getlist("payment_sources")
+        tolerance_days = request.form.get("tolerance_days", 2, type=int)
+
+        if not statement or not statement.filename:
+            abort(400, "Statement file is required")
+
+        if not payment_source_ids:
+            abort(400, "At least one payment source is required")
+
+        payment_source_ids = resolve_payment_source_ids(payment_source_ids)
+
+        upload = StatementUpload(
+            filename=statement.filename[:200],
+            payment_source_ids=",".join(
+                str(ps_id) for ps_id in payment_source_ids
+            ),
+            tolerance_days=min(max(tolerance_days, 0), MAX_TOLERANCE_DAYS),
+            uploaded_by=current_user.id,
+        )
+
+        try:
+            lines = read_statement(statement.stream)
+            db.session.add(upload)
+            db.session.flush()
+            reconcile(upload, lines)
+            db.session.commit()
+        except StatementError as e:
+            db.session.rollback()
+            error = str(e)
+        except IntegrityError:
+            # Another upload linked one of the same payments first
+            db.session.rollback()
+            error = (
+                "Another statement was being reconciled at the same time. "
+                "Please upload this one again."
+            )
+        else:
+            audit.record(
+                "statement_reconciled", "statement_upload", upload.id,
+                after=audit.snapshot(upload),
+            )
+            return redirect(
+                url_for("admin.reconciliation_detail", upload_id=upload.id)
+            )
+
+    uploads = StatementUpload.query.order_by(
+        StatementUpload.created_at.desc()
+    ).limit(50).all()
+    payment_sources = PaymentSource.query.filter_by(
+        is_active=True
+    ).order_by(PaymentSource.name).all()
+
+    return render_template(
+        "admin_reconciliation.html",
+        uploads=uploads,
+        payment_sources=payment_sources,
+        error=error,
+    )
+
+
+@admin_bp.route("/reconciliation/<int:upload_id>")
+@login_required
+def reconciliation_detail(upload_id):
+    if current_user.role != "admin":
+        abort(403)
+
+    upload = StatementUpload.query.get_or_404(upload_id)
+    view = request.args.get("view", "matched")
+    limit = 500
+
+    matches = lines = payments = []
+
+    if view == "matched":
+        matches = (
+            ReconciliationMatch.query
+            .filter_by(upload_id=upload.id)
+            .options(
+                joinedload(ReconciliationMatch.line),
+                joinedload(ReconciliationMatch.payment)
+                .joinedload(FeePayment.admission)
+                .joinedload(Admission.student),
+            )
+            .order_by(ReconciliationMatch.statement_line_id)
+            .limit(limit)
+            .all()
+        )
+    elif view in ("unmatched", "ambiguous"):
+        lines = (
+            StatementLine.query
+            .filter_by(
+                upload_id=upload.id,
+                status=UNMATCHED if view == "unmatched" else AMBIGUOUS,
+            )
+            .order_by(StatementLine.line_no)
+            .limit(limit)
+            .all()
+        )
+    elif view == "payments":
+        # Payments in the statement window not settled by any statement
+        window = timedelta(days=upload.tolerance_days)
+        payments = (
+            FeePayment.query
+            .filter(
+                FeePayment.received_in.in_(
+                    [str(ps_id) for ps_id in upload.source_ids()]
+                ),
+                FeePayment.payment_date.between(
+                    upload.start_date - window,
+                    upload.end_date + window,
+                ),
+                FeePayment.id.notin_(
+                    db.session.query(ReconciliationMatch.fee_payment_id)
+                ),
+            )
+            .options(
+                joinedload(FeePayment.admission)
+                .joinedload(Admission.student)
+            )
+            .order_by(FeePayment.payment_date, FeePayment.id)
+            .limit(limit)
+            .all()
+        )
+    else:
+        abort(400, "Unknown view")
+
+    payment_source_map = {
+        ps.id: ps
+        for ps in PaymentSource.query.filter(
+            PaymentSource.id.in_(upload.source_ids())
+        )
+    }
+
+    return render_template(
+        "admin_reconciliation_detail.html",
+        upload=upload,
+        view=view,
+        limit=limit,
+        matches=matches,
+        lines=lines,
+        payments=payments,
+        payment_source_map=payment_source_map,
+    )
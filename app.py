@@ -34,6 +34,26 @@ def create_app():
     app.config["SQLALCHEMY_DATABASE_URI"] = database_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+    # ----------------------
+    # MAIL (RECEIPT OUTBOX)
+    # ----------------------
+    app.config["MAIL_SERVER"] = os.environ.get("MAIL_SERVER", "localhost")
+    app.config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", 25))
+    app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME")
+    app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD")
+    app.config["MAIL_USE_TLS"] = os.environ.get("MAIL_USE_TLS") == "1"
+    app.config["MAIL_SENDER"] = os.environ.get(
+        "MAIL_SENDER", "no-reply@localhost"
+    )
+
+    # ----------------------
+    # PDF RECEIPTS
+    # ----------------------
+    app.config["RECEIPT_CACHE_DIR"] = os.environ.get("RECEIPT_CACHE_DIR")
+    app.config["RECEIPT_PDF_WORKERS"] = int(
+        os.environ.get("RECEIPT_PDF_WORKERS", 1)
+    )
+
     # ----------------------
     # INIT EXTENSIONS
     # ----------------------
@@ -49,6 +69,29 @@ def create_app():
     def load_user(user_id):
         return User.query.get(int(user_id))
 
+    # ----------------------
+    # BRANCH SCOPING
+    # ----------------------
+    from branching import init_branch_scoping
+
+    init_branch_scoping(app)
+
+    # ----------------------
+    # AUDIT LOG
+    # ----------------------
+    from audit import init_audit
+
+    app.config["AUDIT_BUFFER_SIZE"] = int(
+        os.environ.get("AUDIT_BUFFER_SIZE", 50)
+    )
+    # Vercel freezes idle instances: write entries at the end of each request
+    app.config["AUDIT_FLUSH_SECONDS"] = int(
+        os.environ.get(
+            "AUDIT_FLUSH_SECONDS", 0 if os.environ.get("VERCEL") else 10
+        )
+    )
+    init_audit(app)
+
     # ----------------------
     # BLUEPRINTS
     # ----------------------
@@ -62,6 +105,25 @@ def create_app():
     app.register_blueprint(reception_bp)
     app.register_blueprint(student_bp)
 
+    # ----------------------
+    # CLI COMMANDS
+    # ----------------------
+    from outbox import send_receipts_command
+    from ledger_export import export_ledger_command
+    from branching import assign_branch_command
+    from installments import materialize_installments_command
+    from dues_aging import refresh_dues_aging_command
+    from daily_collections import backfill_daily_collections_command
+    from student.student_routes import link_student_users_command
+
+    app.cli.add_command(send_receipts_command)
+    app.cli.add_command(export_ledger_command)
+    app.cli.add_command(assign_branch_command)
+    app.cli.add_command(materialize_installments_command)
+    app.cli.add_command(refresh_dues_aging_command)
+    app.cli.add_command(backfill_daily_collections_command)
+    app.cli.add_command(link_student_users_command)
+
     return app
 
 
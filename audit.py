@@ -0,0 +1,182 @@
+"""
+Append-only audit log for writes in the admin, reception and auth blueprints.
+
+Each request gets a request id (taken from X-Request-ID when the proxy
+sends one). `record()` captures actor, action, entity and before/after
+values:
+
+* money movements pass `transactional=True`, so the AuditLog row is added
+  to the session and commits (or rolls back) with the payment;
+* everything else is recorded after its write has committed and goes to
+  an in-process buffer, written with one batched INSERT once it holds
+  AUDIT_BUFFER_SIZE entries or AUDIT_FLUSH_SECONDS have passed since the
+  last write.
+
+The age check runs at the end of every request and on a background timer,
+so a quiet worker still writes its entries. With AUDIT_FLUSH_SECONDS = 0
+(the default on Vercel, where idle instances are frozen) every request
+writes its entries before it returns. The buffer is also flushed at
+interpreter exit and before the audit view is read.
+"""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import date, datetime
+
+from flask import current_app, g, has_request_context, request
+from flask_login import current_user
+
+from branching import current_branch_id
+from models import db, AuditLog
+
+_buffer = []
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+_timer_pid = None
+
+SECRET_FIELDS = {"password_hash"}
+
+
+# -------------------------------------------------
+# SNAPSHOTS
+# -------------------------------------------------
+def snapshot(obj, fields=None):
+    """Column values of a model instance, minus secrets."""
+    columns = fields or [c.key for c in obj.__table__.columns]
+    return {
+        key: getattr(obj, key)
+        for key in columns
+        if key not in SECRET_FIELDS
+    }
+
+
+def _to_json(value):
+    if value is None:
+        return None
+
+    def default(o):
+        if isinstance(o, (date, datetime)):
+            return o.isoformat()
+        return str(o)
+
+    return json.dumps(value, default=default, sort_keys=True)
+
+
+# -------------------------------------------------
+# RECORDING
+# -------------------------------------------------
+def record(action, entity_type, entity_id, before=None, after=None,
+           branch_id=None, transactional=False):
+    """
+    Audit one write. With transactional=True the entry joins the current
+    session; otherwise call this after the write has been committed.
+    """
+    authenticated = has_request_context() and current_user.is_authenticated
+
+    entry = {
+        "created_at": datetime.utcnow(),
+        "actor_id": current_user.id if authenticated else None,
+        "actor_email": current_user.email if authenticated else None,
+        "action": action,
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "before_data": _to_json(before),
+        "after_data": _to_json(after),
+        "request_id": g.get("request_id") if has_request_context() else None,
+        "branch_id": branch_id if branch_id is not None else current_branch_id(),
+    }
+
+    if transactional:
+        db.session.add(AuditLog(**entry))
+    else:
+        # Already committed, so it is kept even if the request fails later
+        _enqueue([entry])
+
+
+def _enqueue(entries):
+    with _lock:
+        _buffer.extend(entries)
+    _start_timer(current_app._get_current_object())
+    flush_if_due()
+
+
+def flush_if_due():
+    config = current_app.config
+    with _lock:
+        due = _buffer and (
+            len(_buffer) >= config.get("AUDIT_BUFFER_SIZE", 50)
+            or time.monotonic() - _last_flush
+            >= config.get("AUDIT_FLUSH_SECONDS", 10)
+        )
+    if due:
+        flush()
+
+
+def flush():
+    """Write all buffered entries in one batched INSERT."""
+    global _last_flush
+
+    with _lock:
+        entries = _buffer[:]
+        del _buffer[:]
+        _last_flush = time.monotonic()
+
+    if not entries:
+        return
+
+    try:
+        # Own connection: independent of the request's session
+        with db.engine.begin() as conn:
+            conn.execute(AuditLog.__table__.insert(), entries)
+    except Exception:
+        current_app.logger.exception("Audit flush failed, will retry")
+        with _lock:
+            _buffer[:0] = entries
+
+
+def _start_timer(app):
+    """One daemon flusher per process (gunicorn forks after import)."""
+    global _timer_pid
+
+    interval = app.config.get("AUDIT_FLUSH_SECONDS", 10)
+    if interval <= 0 or _timer_pid == os.getpid():
+        return
+    _timer_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(interval)
+            with app.app_context():
+                flush_if_due()
+
+    threading.Thread(target=run, name="audit-flush", daemon=True).start()
+
+
+# -------------------------------------------------
+# APP WIRING
+# -------------------------------------------------
+def init_audit(app):
+    @app.before_request
+    def assign_request_id():
+        g.request_id = (
+            request.headers.get("X-Request-ID") or uuid.uuid4().hex
+        )[:64]
+
+    @app.after_request
+    def expose_request_id(response):
+        if g.get("request_id"):
+            response.headers["X-Request-ID"] = g.request_id
+        return response
+
+    @app.teardown_request
+    def flush_old_entries(exc):
+        flush_if_due()
+
+    def flush_at_exit():
+        with app.app_context():
+            flush()
+
+    atexit.register(flush_at_exit)
@@ -2,7 +2,8 @@ from flask import Blueprint, render_template, request, redirect, url_for
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from models import Student, User, db, generate_student_id
+import audit
+from models import Branch, Student, User, db, generate_student_id
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -13,37 +14,60 @@ auth_bp = Blueprint('auth', __name__)
 @auth_bp.route("/admission", methods=["GET", "POST"])
 def admission():
     message = ""
+    branches = Branch.query.order_by(Branch.name).all()
 
     if request.method == "POST":
         name = request.form.get("name")
         mobile = request.form.get("mobile")
         email = request.form.get("email")
-
-        existing_student = Student.query.filter_by(mobile=mobile).first()
-        existing_user = User.query.filter_by(email=email).first()
-
-        if existing_student or existing_user:
+        branch_id = request.form.get("branch_id", type=int)
+
+        # Mobile and email are unique across all branches
+        existing_student = Student.query.filter_by(
+            mobile=mobile
+        ).execution_options(all_branches=True).first()
+        existing_user = User.query.filter_by(
+            email=email
+        ).execution_options(all_branches=True).first()
+
+        if branch_id is not None and not db.session.get(Branch, branch_id):
+            message = "Please choose a valid branch."
+        elif existing_student or existing_user:
             message = "Student already registered."
         else:
             student = Student(
                 student_id=generate_student_id(),
                 name=name,
                 mobile=mobile,
-                email=email
+                email=email,
+                branch_id=branch_id
             )
             db.session.add(student)
 
             user = User(
                 email=email,
                 password_hash=generate_password_hash(mobile),
-                role="student"
+                role="student",
+                branch_id=branch_id,
+                student=student
             )
             db.session.add(user)
             db.session.commit()
 
+            audit.record(
+                "student_registered", "student", student.id,
+                after=audit.snapshot(student), branch_id=student.branch_id,
+            )
+            audit.record(
+                "user_created", "user", user.id,
+                after=audit.snapshot(user), branch_id=user.branch_id,
+            )
+
             message = "Admission successful. Password is your mobile number."
 
-    return render_template("admission.html", message=message)
+    return render_template(
+        "admission.html", message=message, branches=branches
+    )
 
 
 # ----------------------------
@@ -57,7 +81,10 @@ def login():
         email = request.form.get("email")
         password = request.form.get("password")
 
-        user = User.query.filter_by(email=email).first()
+        # A previous session's branch must not hide other branches' users
+        user = User.query.filter_by(
+            email=email
+        ).execution_options(all_branches=True).first()
 
         if user and check_password_hash(user.password_hash, password):
             login_user(user)
@@ -101,6 +128,7 @@ def change_password():
         else:
             current_user.password_hash = generate_password_hash(new_password)
             db.session.commit()
+            audit.record("password_changed", "user", current_user.id)
             message = "Password changed successfully"
 
     return render_template("change_password.html", message=message)
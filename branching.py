@@ -0,0 +1,145 @@
+"""
+Branch scoping for a shared multi-branch database.
+
+Every request remembers the logged-in user's branch in `g.branch_id`.
+ORM queries issued during that request are then filtered to that branch
+for all BranchScoped models (Student, User, Batch, Admission, FeePayment),
+and new rows are stamped with it on flush.
+
+Users without a branch (head office) see every branch. CLI commands run
+outside a request and are never scoped. Pass
+`.execution_options(all_branches=True)` to skip the filter explicitly;
+logins and uniqueness checks (batch codes, student mobiles, user emails
+are unique across all branches) must do so.
+"""
+import click
+from flask import g, has_request_context
+from flask.cli import with_appcontext
+from flask_login import current_user
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from models import (
+    db,
+    Branch,
+    BranchScoped,
+    Student,
+    User,
+    Batch,
+    Admission,
+    FeePayment,
+    AdmissionInstallment,
+    AdmissionDuesAging,
+    DailyCollection,
+)
+
+# Rows owned directly by a branch, moved by `flask assign-branch`
+ASSIGNABLE_MODELS = (Student, User, Batch, Admission, FeePayment)
+
+# Rollups copy their branch from the row they derive from
+DERIVED_MODELS = (
+    (AdmissionInstallment, Admission, "admission_id"),
+    (AdmissionDuesAging, Admission, "admission_id"),
+    (DailyCollection, Batch, "batch_id"),
+)
+
+# The audit log and statement uploads are history and never move
+
+
+def current_branch_id():
+    if not has_request_context():
+        return None
+    return g.get("branch_id")
+
+
+def _scope_queries(execute_state):
+    if execute_state.execution_options.get("all_branches"):
+        return
+
+    if execute_state.is_column_load or execute_state.is_relationship_load:
+        # Criteria from the parent statement already propagate here
+        return
+
+    if not (execute_state.is_select or execute_state.is_update
+            or execute_state.is_delete):
+        return
+
+    branch_id = current_branch_id()
+    if branch_id is None:
+        return
+
+    execute_state.statement = execute_state.statement.options(
+        with_loader_criteria(
+            BranchScoped,
+            lambda cls: cls.branch_id == branch_id,
+            include_aliases=True,
+        )
+    )
+
+
+def _stamp_new_rows(session, flush_context, instances):
+    # Fallback only: rows that belong to a batch or admission take that
+    # row's branch explicitly, since head-office users have no branch
+    branch_id = current_branch_id()
+    if branch_id is None:
+        return
+
+    for obj in session.new:
+        if isinstance(obj, BranchScoped) and obj.branch_id is None:
+            obj.branch_id = branch_id
+
+
+def init_branch_scoping(app):
+    @app.before_request
+    def load_branch():
+        # Loading current_user here runs before g.branch_id exists,
+        # so the user lookup itself is never filtered
+        g.branch_id = (
+            current_user.branch_id
+            if current_user.is_authenticated
+            else None
+        )
+
+    if not event.contains(Session, "do_orm_execute", _scope_queries):
+        event.listen(Session, "do_orm_execute", _scope_queries)
+        event.listen(Session, "before_flush", _stamp_new_rows)
+
+
+# -------------------------------------------------
+# CLI: flask assign-branch
+# -------------------------------------------------
+@click.command("assign-branch")
+@click.argument("name")
+@with_appcontext
+def assign_branch_command(name):
+    """Create branch NAME and move all unassigned rows into it."""
+    branch = Branch.query.filter_by(name=name).first()
+    if not branch:
+        branch = Branch(name=name)
+        db.session.add(branch)
+        db.session.flush()
+
+    for model in ASSIGNABLE_MODELS:
+        query = model.query.filter(model.branch_id.is_(None))
+        if model is User:
+            # Admins stay unassigned so they keep the all-branch view
+            query = query.filter(User.role != "admin")
+
+        count = query.update(
+            {"branch_id": branch.id}, synchronize_session=False
+        )
+        click.echo(f"{model.__tablename__}: {count} rows")
+
+    for model, parent, foreign_key in DERIVED_MODELS:
+        count = model.query.filter(model.branch_id.is_(None)).update(
+            {
+                "branch_id": select(parent.branch_id)
+                .where(parent.id == getattr(model, foreign_key))
+                .scalar_subquery()
+            },
+            synchronize_session=False,
+        )
+        click.echo(f"{model.__tablename__}: {count} rows")
+
+    db.session.commit()
+    click.echo(f"Branch '{name}' has id {branch.id}")
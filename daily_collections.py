@@ -0,0 +1,129 @@
+"""
+Daily collection rollup.
+
+daily_collections keeps one row per (date, batch, payment source) with the
+number of payments and the amount collected. Reception bumps the row in
+the same transaction as each FeePayment, so trend reports never have to
+scan the ledger. `flask backfill-daily-collections` rebuilds a date range
+from FeePayment.
+"""
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from models import db, Admission, DailyCollection, FeePayment
+
+
+def _source_id(received_in):
+    try:
+        return int(received_in)
+    except (TypeError, ValueError):
+        return 0
+
+
+def record_collection(payment, admission):
+    """Add one payment to its rollup row. Caller commits."""
+    collection_date = payment.payment_date or date.today()
+    source_id = _source_id(payment.received_in)
+
+    def bump():
+        return db.session.query(DailyCollection).filter_by(
+            collection_date=collection_date,
+            batch_id=admission.batch_id,
+            payment_source_id=source_id,
+        ).update({
+            DailyCollection.payment_count: DailyCollection.payment_count + 1,
+            DailyCollection.amount: DailyCollection.amount + payment.amount,
+        }, synchronize_session=False)
+
+    if bump():
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.add(DailyCollection(
+                collection_date=collection_date,
+                batch_id=admission.batch_id,
+                payment_source_id=source_id,
+                branch_id=admission.branch_id,
+                payment_count=1,
+                amount=payment.amount,
+            ))
+    except IntegrityError:
+        # Another request created the row first
+        bump()
+
+
+def backfill(start=None, end=None):
+    """Rebuild rollup rows for [start, end] from FeePayment. Caller commits."""
+    source_id = func.coalesce(FeePayment.received_in.cast(db.Integer), 0)
+
+    delete_query = DailyCollection.query
+    source_query = (
+        db.session.query(
+            FeePayment.payment_date,
+            Admission.batch_id,
+            source_id,
+            Admission.branch_id,
+            func.count(FeePayment.id),
+            func.sum(FeePayment.amount),
+        )
+        .join(Admission, Admission.id == FeePayment.admission_id)
+        .filter(FeePayment.payment_date.isnot(None))
+    )
+
+    if start:
+        delete_query = delete_query.filter(
+            DailyCollection.collection_date >= start
+        )
+        source_query = source_query.filter(FeePayment.payment_date >= start)
+    if end:
+        delete_query = delete_query.filter(
+            DailyCollection.collection_date <= end
+        )
+        source_query = source_query.filter(FeePayment.payment_date <= end)
+
+    delete_query.delete(synchronize_session=False)
+
+    rows = [
+        {
+            "collection_date": payment_date,
+            "batch_id": batch_id,
+            "payment_source_id": ps_id,
+            "branch_id": branch_id,
+            "payment_count": count,
+            "amount": amount,
+        }
+        for payment_date, batch_id, ps_id, branch_id, count, amount
+        in source_query.group_by(
+            FeePayment.payment_date,
+            Admission.batch_id,
+            source_id,
+            Admission.branch_id,
+        ).all()
+    ]
+
+    if rows:
+        db.session.execute(DailyCollection.__table__.insert(), rows)
+    return len(rows)
+
+
+# -------------------------------------------------
+# CLI: flask backfill-daily-collections
+# -------------------------------------------------
+def _parse_date(ctx, param, value):
+    return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+
+
+@click.command("backfill-daily-collections")
+@click.option("--start", callback=_parse_date, help="YYYY-MM-DD")
+@click.option("--end", callback=_parse_date, help="YYYY-MM-DD")
+@with_appcontext
+def backfill_daily_collections_command(start, end):
+    """Rebuild the daily collection rollup from fee payments."""
+    count = backfill(start, end)
+    db.session.commit()
+    click.echo(f"Rollup rows written: {count}")
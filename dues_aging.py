@@ -0,0 +1,117 @@
+"""
+Dues-aging rollup.
+
+admission_dues_aging holds one row per admission with a pending balance:
+the amount, the last payment date and an age bucket counted from the last
+payment (or the admission date if nothing was paid). The admin aging
+report reads only this table.
+
+`flask refresh-dues-aging` rebuilds it nightly so buckets move with the
+calendar; reception payments refresh their own admission in the same
+transaction.
+"""
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func
+
+from models import db, Admission, AdmissionDuesAging, Batch, FeePayment
+
+BUCKETS = ["0-30", "31-60", "61-90", "90+"]
+
+
+def bucket_for(age_days):
+    if age_days <= 30:
+        return "0-30"
+    if age_days <= 60:
+        return "31-60"
+    if age_days <= 90:
+        return "61-90"
+    return "90+"
+
+
+def refresh_aging(admission_ids=None, as_of=None, chunk_size=1000):
+    """
+    Recompute aging rows for admission_ids (or every admission).
+
+    One grouped query supplies the last payment date per admission; the
+    old rows are replaced with chunked bulk inserts. The caller commits.
+    """
+    as_of = as_of or date.today()
+
+    last_payment = db.session.query(
+        FeePayment.admission_id,
+        func.max(FeePayment.payment_date).label("last_payment_date"),
+    )
+    if admission_ids is not None:
+        last_payment = last_payment.filter(
+            FeePayment.admission_id.in_(admission_ids)
+        )
+    last_payment = last_payment.group_by(FeePayment.admission_id).subquery()
+
+    query = (
+        db.session.query(
+            Admission.id,
+            Admission.branch_id,
+            Admission.batch_id,
+            Admission.pending_amount,
+            Admission.admission_date,
+            Batch.course_name,
+            last_payment.c.last_payment_date,
+        )
+        .join(Batch, Batch.id == Admission.batch_id)
+        .outerjoin(last_payment, last_payment.c.admission_id == Admission.id)
+        .filter(Admission.pending_amount > 0)
+    )
+
+    delete_query = AdmissionDuesAging.query
+    if admission_ids is not None:
+        query = query.filter(Admission.id.in_(admission_ids))
+        delete_query = delete_query.filter(
+            AdmissionDuesAging.admission_id.in_(admission_ids)
+        )
+    delete_query.delete(synchronize_session=False)
+
+    now = datetime.utcnow()
+    rows = []
+    total = 0
+
+    for row in query.all():
+        since = row.last_payment_date or row.admission_date or as_of
+        age_days = max((as_of - since).days, 0)
+
+        rows.append({
+            "admission_id": row.id,
+            "branch_id": row.branch_id,
+            "batch_id": row.batch_id,
+            "course_name": row.course_name,
+            "pending_amount": row.pending_amount,
+            "last_payment_date": row.last_payment_date,
+            "age_days": age_days,
+            "bucket": bucket_for(age_days),
+            "refreshed_at": now,
+        })
+
+        if len(rows) >= chunk_size:
+            db.session.execute(AdmissionDuesAging.__table__.insert(), rows)
+            total += len(rows)
+            rows = []
+
+    if rows:
+        db.session.execute(AdmissionDuesAging.__table__.insert(), rows)
+        total += len(rows)
+
+    return total
+
+
+# -------------------------------------------------
+# CLI: flask refresh-dues-aging
+# -------------------------------------------------
+@click.command("refresh-dues-aging")
+@with_appcontext
+def refresh_dues_aging_command():
+    """Rebuild the dues-aging rollup (run nightly)."""
+    count = refresh_aging()
+    db.session.commit()
+    click.echo(f"Aging rows: {count}")
@@ -0,0 +1,115 @@
+"""
+Installment schedules.
+
+A batch can define an installment plan (BatchInstallment rows: amount due
+N days after admission). At admission time the plan is copied into
+AdmissionInstallment rows with concrete due dates, and every payment is
+allocated against the oldest unsettled installment first.
+
+Batches without a plan get a single installment for the full fee, due on
+the admission date, so every admission shows up in the due-date queue.
+"""
+from datetime import timedelta
+
+import click
+from flask.cli import with_appcontext
+
+from models import db, Admission, AdmissionInstallment, BatchInstallment
+
+
+def create_installments(admission):
+    """Materialize the batch plan for a new admission. Caller commits."""
+    plan = BatchInstallment.query.filter_by(
+        batch_id=admission.batch_id
+    ).order_by(BatchInstallment.sequence).all()
+
+    if not plan:
+        plan = [BatchInstallment(
+            sequence=1, due_after_days=0, amount=admission.total_fee
+        )]
+
+    installments = []
+    remaining = admission.total_fee
+
+    for index, item in enumerate(plan):
+        # Last installment absorbs any mismatch between plan and fee
+        if index == len(plan) - 1:
+            amount = remaining
+        else:
+            amount = min(item.amount, remaining)
+        remaining -= amount
+
+        installments.append(AdmissionInstallment(
+            admission_id=admission.id,
+            branch_id=admission.branch_id,
+            sequence=item.sequence,
+            due_date=admission.admission_date
+            + timedelta(days=item.due_after_days),
+            amount=amount,
+            paid_amount=0,
+            is_settled=amount <= 0,
+        ))
+
+    db.session.add_all(installments)
+    return installments
+
+
+def allocate_payment(admission, amount):
+    """Apply a payment to unsettled installments, oldest first. Caller commits."""
+    open_installments = AdmissionInstallment.query.filter_by(
+        admission_id=admission.id,
+        is_settled=False,
+    ).order_by(
+        AdmissionInstallment.due_date,
+        AdmissionInstallment.sequence,
+    ).all()
+
+    for installment in open_installments:
+        if amount <= 0:
+            break
+
+        applied = min(amount, installment.amount - installment.paid_amount)
+        installment.paid_amount += applied
+        amount -= applied
+
+        if installment.paid_amount >= installment.amount:
+            installment.is_settled = True
+
+
+def due_installments(until, options=()):
+    """Unsettled installments due on or before `until`, oldest first."""
+    return (
+        AdmissionInstallment.query
+        .filter(
+            # "= 0", not "IS false": MySQL only range-scans the index on =
+            AdmissionInstallment.is_settled == False,
+            AdmissionInstallment.due_date <= until,
+        )
+        .options(*options)
+        .order_by(AdmissionInstallment.due_date, AdmissionInstallment.id)
+        .all()
+    )
+
+
+# -------------------------------------------------
+# CLI: flask materialize-installments
+# -------------------------------------------------
+@click.command("materialize-installments")
+@with_appcontext
+def materialize_installments_command():
+    """Create installment rows for admissions that predate installment plans."""
+    has_installments = db.session.query(
+        AdmissionInstallment.admission_id
+    ).distinct()
+
+    admissions = Admission.query.filter(
+        Admission.id.not_in(has_installments)
+    ).all()
+
+    for admission in admissions:
+        create_installments(admission)
+        db.session.flush()
+        allocate_payment(admission, admission.paid_amount or 0)
+
+    db.session.commit()
+    click.echo(f"Created installments for {len(admissions)} admissions")
@@ -0,0 +1,290 @@
+"""
+Incremental export of the fee ledger for the accountants.
+
+`flask export-ledger` writes one compressed file per table per run into
+the export directory and records it in `manifest.json`:
+
+    exports/
+        manifest.json
+        fee_payment/part-20260101T020000.parquet
+        admission/part-20260101T020000.parquet
+        ...
+
+Each run only reads rows stamped since the previous watermark:
+
+* student, fee_payment      - append-only, watermark on created_at
+* admission, batch          - mutable, watermark on updated_at
+
+Rows are stamped when they are flushed, which can be a while before their
+transaction commits, and ids are not committed in order either. Each run
+therefore stops `lag` seconds before its start time, and the next run picks
+up from there, so a row is only missed if its transaction took longer than
+the lag to commit.
+
+A changed admission is appended again, so readers should keep the latest
+row per id. Deletes (e.g. removing a batch with its admissions and
+payments) are NOT exported; readers that need them must compare against a
+fresh full export. Parquet / Arrow IPC need pyarrow; without it the export
+falls back to gzipped CSV.
+"""
+import csv
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import or_, select
+
+from models import db, Student, Admission, FeePayment, Batch
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+
+
+# table name -> (model, watermark column)
+EXPORT_TABLES = {
+    "student": (Student, "created_at"),
+    "batch": (Batch, "updated_at"),
+    "admission": (Admission, "updated_at"),
+    "fee_payment": (FeePayment, "created_at"),
+}
+
+DEFAULT_LAG_SECONDS = 300
+
+MANIFEST_NAME = "manifest.json"
+
+
+# -------------------------------------------------
+# MANIFEST
+# -------------------------------------------------
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {"runs": [], "tables": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# -------------------------------------------------
+# WRITERS
+# -------------------------------------------------
+def _arrow_type(column):
+    python_type = column.type.python_type
+    if python_type is bool:
+        return pa.bool_()
+    if python_type is int:
+        return pa.int64()
+    if python_type is datetime:
+        return pa.timestamp("us")
+    if python_type.__name__ == "date":
+        return pa.date32()
+    return pa.string()
+
+
+class ArrowPartWriter:
+    """Streams chunks into one Parquet or Arrow IPC file."""
+
+    def __init__(self, path, columns, fmt):
+        self.schema = pa.schema([(c.name, _arrow_type(c)) for c in columns])
+        if fmt == "parquet":
+            self.writer = pq.ParquetWriter(
+                path, self.schema, compression="zstd"
+            )
+        else:
+            self.writer = pa_ipc.new_file(
+                path, self.schema,
+                options=pa_ipc.IpcWriteOptions(compression="zstd"),
+            )
+
+    def write(self, rows):
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays(
+            [pa.array(values, type=field.type)
+             for values, field in zip(columns, self.schema)],
+            schema=self.schema,
+        )
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+class CsvPartWriter:
+    """Gzipped CSV fallback when pyarrow is not installed."""
+
+    def __init__(self, path, columns, fmt=None):
+        self.file = gzip.open(path, "wt", newline="")
+        self.writer = csv.writer(self.file)
+        self.writer.writerow([c.name for c in columns])
+
+    def write(self, rows):
+        self.writer.writerows(
+            [v.isoformat() if hasattr(v, "isoformat") else v for v in row]
+            for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+
+FILE_EXTENSIONS = {
+    "parquet": ".parquet",
+    "ipc": ".arrow",
+    "csv": ".csv.gz",
+}
+
+
+# -------------------------------------------------
+# EXPORT
+# -------------------------------------------------
+def export_table(name, out_dir, run_id, state, fmt, chunk_size, cutoff):
+    """
+    Export rows of one table past its watermark.
+
+    Rows are read in id order with keyset pagination, so memory stays at
+    one chunk no matter how large the table is. Returns the partition
+    entry for the manifest (or None) and the new watermark state.
+    """
+    model, watermark_column = EXPORT_TABLES[name]
+    table = model.__table__
+    columns = list(table.columns)
+    stamp = table.c[watermark_column]
+
+    query = select(*columns)
+    last = state.get("last_stamp")
+
+    if last:
+        query = query.where(
+            stamp >= datetime.fromisoformat(last),
+            stamp < cutoff,
+        )
+    else:
+        # First run takes the whole table, including unstamped rows
+        query = query.where(or_(stamp < cutoff, stamp.is_(None)))
+
+    # Never move backwards, e.g. when a run uses a longer lag
+    new_state = {
+        "last_stamp": max(
+            cutoff, datetime.fromisoformat(last) if last else cutoff
+        ).isoformat()
+    }
+
+    writer_class = ArrowPartWriter if fmt in ("parquet", "ipc") else CsvPartWriter
+    filename = f"part-{run_id}{FILE_EXTENSIONS[fmt]}"
+    relative_path = os.path.join(name, filename)
+    path = os.path.join(out_dir, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    writer = None
+    row_count = 0
+    last_id = 0
+
+    try:
+        while True:
+            rows = db.session.execute(
+                query.where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+
+            if writer is None:
+                writer = writer_class(path, columns, fmt)
+            writer.write(rows)
+
+            row_count += len(rows)
+            last_id = rows[-1].id
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if row_count == 0:
+        return None, new_state
+
+    return {
+        "run": run_id,
+        "path": relative_path.replace(os.sep, "/"),
+        "format": fmt,
+        "rows": row_count,
+    }, new_state
+
+
+def run_export(out_dir, fmt, chunk_size=5000,
+               lag_seconds=DEFAULT_LAG_SECONDS):
+    """Export every ledger table incrementally and update the manifest."""
+    if fmt != "csv" and pa is None:
+        fmt = "csv"
+
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+
+    # Whole seconds: MySQL DATETIME drops microseconds on the stamps
+    started_at = datetime.utcnow().replace(microsecond=0)
+    run_id = started_at.strftime("%Y%m%dT%H%M%S")
+
+    # Rows stamped after this may still be uncommitted; next run gets them
+    cutoff = started_at - timedelta(seconds=lag_seconds)
+    summary = {}
+
+    for name in EXPORT_TABLES:
+        entry = manifest["tables"].setdefault(
+            name, {"watermark": {}, "partitions": []}
+        )
+        partition, entry["watermark"] = export_table(
+            name, out_dir, run_id, entry["watermark"],
+            fmt, chunk_size, cutoff,
+        )
+        if partition:
+            entry["partitions"].append(partition)
+        summary[name] = partition["rows"] if partition else 0
+
+    manifest["runs"].append({
+        "run": run_id,
+        "started_at": started_at.isoformat(),
+        "cutoff": cutoff.isoformat(),
+        "format": fmt,
+        "rows": summary,
+    })
+    save_manifest(out_dir, manifest)
+    return run_id, summary
+
+
+# -------------------------------------------------
+# CLI: flask export-ledger
+# -------------------------------------------------
+@click.command("export-ledger")
+@click.option("--out", "out_dir", default="exports", show_default=True)
+@click.option("--format", "fmt", default="parquet", show_default=True,
+              type=click.Choice(["parquet", "ipc", "csv"]))
+@click.option("--chunk-size", default=5000, show_default=True)
+@click.option("--lag-seconds", default=DEFAULT_LAG_SECONDS, show_default=True,
+              help="Leave rows stamped this recently for the next run.")
+@with_appcontext
+def export_ledger_command(out_dir, fmt, chunk_size, lag_seconds):
+    """Append new and changed ledger rows to the export directory.
+
+    Deleted rows are not exported.
+    """
+    if fmt != "csv" and pa is None:
+        click.echo("pyarrow not installed, falling back to CSV")
+
+    run_id, summary = run_export(out_dir, fmt, chunk_size, lag_seconds)
+
+    click.echo(f"Export run {run_id}")
+    for name, rows in summary.items():
+        click.echo(f"  {name}: {rows} rows")
@@ -1,28 +1,56 @@
 from datetime import datetime, date
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import declared_attr
 
 db = SQLAlchemy()
 
 
-class Student(db.Model):
+class Branch(db.Model):
+    __tablename__ = "branches"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class BranchScoped:
+    """Rows owned by one branch; queries are filtered by branching.py."""
+
+    @declared_attr
+    def branch_id(cls):
+        return db.Column(db.Integer, db.ForeignKey("branches.id"))
+
+
+class Student(BranchScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.String(20), unique=True, nullable=False)
     name = db.Column(db.String(100), nullable=False)
     mobile = db.Column(db.String(15), unique=True, nullable=False)
     email = db.Column(db.String(100), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index("ix_student_branch_created", "branch_id", "created_at"),
+    )
 
 
-class User(UserMixin, db.Model):
+class User(BranchScoped, UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(100), unique=True, nullable=False)
     password_hash = db.Column(db.String(200), nullable=False)
     role = db.Column(db.String(20), nullable=False)
+    student_id = db.Column(db.Integer, db.ForeignKey("student.id"), index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    student = db.relationship("Student")
+
+    __table_args__ = (
+        db.Index("ix_user_branch_role", "branch_id", "role"),
+    )
+
 
-class Batch(db.Model):
+class Batch(BranchScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     batch_code = db.Column(db.String(50), unique=True, nullable=False)
     course_name = db.Column(db.String(100), nullable=False)
@@ -31,6 +59,14 @@ class Batch(db.Model):
     end_date = db.Column(db.Date)
     status = db.Column(db.String(20), default="Active")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True
+    )
+
+    __table_args__ = (
+        db.Index("ix_batch_branch_code", "branch_id", "batch_code"),
+        db.Index("ix_batch_branch_status", "branch_id", "status"),
+    )
 
 
 class PaymentSource(db.Model):
@@ -57,8 +93,41 @@ class BatchPaymentSource(db.Model):
     batch = db.relationship("Batch")
     payment_source = db.relationship("PaymentSource")
 
+    __table_args__ = (
+        db.Index("ix_batch_payment_sources_batch", "batch_id", "priority"),
+    )
+
+
+class PaymentSourceTemplate(db.Model):
+    __tablename__ = "payment_source_templates"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    items = db.relationship(
+        "PaymentSourceTemplateItem",
+        order_by="PaymentSourceTemplateItem.priority",
+        cascade="all, delete-orphan",
+    )
+
+
+class PaymentSourceTemplateItem(db.Model):
+    __tablename__ = "payment_source_template_items"
 
-class Admission(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    template_id = db.Column(
+        db.Integer, db.ForeignKey("payment_source_templates.id"), nullable=False
+    )
+    payment_source_id = db.Column(
+        db.Integer, db.ForeignKey("payment_sources.id"), nullable=False
+    )
+    priority = db.Column(db.Integer, nullable=False)
+
+    payment_source = db.relationship("PaymentSource")
+
+
+class Admission(BranchScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey("student.id"), nullable=False)
     batch_id = db.Column(db.Integer, db.ForeignKey("batch.id"), nullable=False)
@@ -71,13 +140,25 @@ class Admission(db.Model):
     admission_date = db.Column(db.Date, default=date.today)
     status = db.Column(db.String(20), default="Active")
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(
+        db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True
+    )
 
-    student = db.relationship("Student")
+    student = db.relationship(
+        "Student", backref=db.backref("admissions", order_by="Admission.id")
+    )
     batch = db.relationship("Batch")
-    payments = db.relationship("FeePayment", backref="admission")
+    payments = db.relationship(
+        "FeePayment", backref="admission", order_by="FeePayment.id"
+    )
+
+    __table_args__ = (
+        db.Index("ix_admission_branch_batch", "branch_id", "batch_id"),
+        db.Index("ix_admission_branch_date", "branch_id", "admission_date"),
+    )
 
 
-class FeePayment(db.Model):
+class FeePayment(BranchScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     admission_id = db.Column(
         db.Integer, db.ForeignKey("admission.id"), nullable=False
@@ -86,8 +167,209 @@ class FeePayment(db.Model):
     payment_date = db.Column(db.Date, default=date.today)
     payment_mode = db.Column(db.String(20))
     received_in = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index("ix_fee_payment_branch_date", "branch_id", "payment_date"),
+    )
+
+
+class BatchInstallment(db.Model):
+    __tablename__ = "batch_installments"
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey("batch.id"), nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)
+    due_after_days = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Integer, nullable=False)
+
+    batch = db.relationship("Batch")
+
+    __table_args__ = (
+        db.Index("ix_batch_installments_batch", "batch_id", "sequence"),
+    )
+
+
+class AdmissionInstallment(BranchScoped, db.Model):
+    __tablename__ = "admission_installments"
+
+    id = db.Column(db.Integer, primary_key=True)
+    admission_id = db.Column(
+        db.Integer, db.ForeignKey("admission.id"), nullable=False
+    )
+    sequence = db.Column(db.Integer, nullable=False)
+    due_date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    paid_amount = db.Column(db.Integer, nullable=False, default=0)
+    is_settled = db.Column(db.Boolean, nullable=False, default=False)
+
+    admission = db.relationship("Admission", backref="installments")
+
+    __table_args__ = (
+        # Due-date queue: one range scan per branch (or across branches)
+        db.Index(
+            "ix_installment_branch_due", "branch_id", "is_settled", "due_date"
+        ),
+        db.Index("ix_installment_due", "is_settled", "due_date"),
+        db.Index("ix_installment_admission", "admission_id", "sequence"),
+    )
+
+
+class AdmissionDuesAging(BranchScoped, db.Model):
+    __tablename__ = "admission_dues_aging"
+
+    admission_id = db.Column(
+        db.Integer, db.ForeignKey("admission.id"), primary_key=True
+    )
+    batch_id = db.Column(db.Integer, db.ForeignKey("batch.id"), nullable=False)
+    course_name = db.Column(db.String(100), nullable=False)
+    pending_amount = db.Column(db.Integer, nullable=False)
+    last_payment_date = db.Column(db.Date)
+    age_days = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.String(10), nullable=False)
+    refreshed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    admission = db.relationship("Admission")
+    batch = db.relationship("Batch")
+
+    __table_args__ = (
+        db.Index("ix_dues_aging_branch_bucket", "branch_id", "bucket", "batch_id"),
+        db.Index("ix_dues_aging_bucket", "bucket", "batch_id"),
+    )
+
+
+class DailyCollection(BranchScoped, db.Model):
+    __tablename__ = "daily_collections"
+
+    id = db.Column(db.Integer, primary_key=True)
+    collection_date = db.Column(db.Date, nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey("batch.id"), nullable=False)
+    # payment_sources.id taken from FeePayment.received_in; 0 = unknown
+    payment_source_id = db.Column(db.Integer, nullable=False, default=0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint(
+            "collection_date", "batch_id", "payment_source_id",
+            name="uq_daily_collection",
+        ),
+        db.Index("ix_daily_collection_branch_date", "branch_id", "collection_date"),
+    )
+
+
+class AuditLog(BranchScoped, db.Model):
+    __tablename__ = "audit_log"
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    actor_id = db.Column(db.Integer)
+    actor_email = db.Column(db.String(100))
+    action = db.Column(db.String(50), nullable=False)
+    entity_type = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer)
+    before_data = db.Column(db.Text)
+    after_data = db.Column(db.Text)
+    request_id = db.Column(db.String(64))
+
+    __table_args__ = (
+        db.Index("ix_audit_entity", "entity_type", "entity_id", "created_at"),
+        db.Index("ix_audit_branch_created", "branch_id", "created_at"),
+    )
+
+
+class StatementUpload(BranchScoped, db.Model):
+    __tablename__ = "statement_uploads"
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(200), nullable=False)
+    # Comma-separated payment_sources.id the statement settles
+    payment_source_ids = db.Column(db.String(200), nullable=False)
+    tolerance_days = db.Column(db.Integer, nullable=False, default=2)
+    start_date = db.Column(db.Date)
+    end_date = db.Column(db.Date)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    matched_count = db.Column(db.Integer, nullable=False, default=0)
+    unmatched_count = db.Column(db.Integer, nullable=False, default=0)
+    ambiguous_count = db.Column(db.Integer, nullable=False, default=0)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey("user.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    def source_ids(self):
+        return [int(ps_id) for ps_id in self.payment_source_ids.split(",")]
+
+
+class StatementLine(db.Model):
+    __tablename__ = "statement_lines"
+
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(
+        db.Integer, db.ForeignKey("statement_uploads.id"), nullable=False
+    )
+    line_no = db.Column(db.Integer, nullable=False)
+    txn_date = db.Column(db.Date, nullable=False)
+    amount = db.Column(db.Integer, nullable=False)
+    reference = db.Column(db.String(100))
+    description = db.Column(db.String(200))
+    # Matched / Unmatched / Ambiguous
+    status = db.Column(db.String(20), nullable=False)
+    candidate_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_statement_line_upload_status", "upload_id", "status"),
+    )
+
+
+class ReconciliationMatch(db.Model):
+    __tablename__ = "reconciliation_matches"
+
+    id = db.Column(db.Integer, primary_key=True)
+    upload_id = db.Column(
+        db.Integer, db.ForeignKey("statement_uploads.id"), nullable=False
+    )
+    statement_line_id = db.Column(
+        db.Integer, db.ForeignKey("statement_lines.id"),
+        nullable=False, unique=True,
+    )
+    # A payment settles once, whichever statement it shows up in
+    fee_payment_id = db.Column(
+        db.Integer, db.ForeignKey("fee_payment.id"),
+        nullable=False, unique=True,
+    )
+    day_difference = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    line = db.relationship("StatementLine")
+    payment = db.relationship("FeePayment")
+
+    __table_args__ = (
+        db.Index("ix_reconciliation_match_upload", "upload_id"),
+    )
+
+
+class EmailOutbox(db.Model):
+    __tablename__ = "email_outbox"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False, default="receipt")
+    fee_payment_id = db.Column(db.Integer, db.ForeignKey("fee_payment.id"))
+    recipient = db.Column(db.String(100), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text)
+
+    status = db.Column(db.String(20), nullable=False, default="Pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    sent_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    payment = db.relationship("FeePayment")
+
+    __table_args__ = (
+        db.Index("ix_email_outbox_status_next", "status", "next_attempt_at"),
+    )
+
 
 def generate_student_id():
     return "STD" + datetime.utcnow().strftime("%Y%m%d%H%M%S")
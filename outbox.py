@@ -0,0 +1,223 @@
+"""
+Transactional outbox for receipt emails.
+
+Payments enqueue an EmailOutbox row in the same transaction as the
+FeePayment, so the payment request never talks to SMTP. The dispatcher
+(`flask send-receipts`) picks up pending rows in batches and sends them
+over a single reused SMTP connection.
+
+To try it locally, run an SMTP stand-in and point the app at it:
+
+    python -m aiosmtpd -n -l localhost:1025
+    MAIL_SERVER=localhost MAIL_PORT=1025 flask send-receipts --once
+"""
+import smtplib
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from models import db, EmailOutbox
+from receipt_pdf import render_receipt_html
+
+
+# -------------------------------------------------
+# ENQUEUE (CALLED INSIDE THE PAYMENT TRANSACTION)
+# -------------------------------------------------
+def enqueue_receipt(payment, student):
+    """
+    Queue a receipt email; the caller commits it with the payment.
+
+    The body is rendered now, with totals as of this payment, and stored
+    on the row, so retries resend exactly this receipt.
+    """
+    if not student.email:
+        return None
+
+    # Receipt number and date are assigned on flush
+    db.session.flush()
+
+    message = EmailOutbox(
+        kind="receipt",
+        payment=payment,
+        recipient=student.email,
+        subject="Payment Receipt - Sharada Academy",
+        body=render_receipt_html(
+            payment, payment.admission, student, pdf=False
+        ),
+        status="Pending",
+    )
+    db.session.add(message)
+    return message
+
+
+# -------------------------------------------------
+# POOLED SMTP CONNECTION
+# -------------------------------------------------
+class SMTPConnection:
+    """One SMTP session reused across a batch, reconnecting when dropped."""
+
+    def __init__(self, config):
+        self.host = config.get("MAIL_SERVER", "localhost")
+        self.port = int(config.get("MAIL_PORT", 25))
+        self.username = config.get("MAIL_USERNAME")
+        self.password = config.get("MAIL_PASSWORD")
+        self.use_tls = config.get("MAIL_USE_TLS", False)
+        self.timeout = int(config.get("MAIL_TIMEOUT", 30))
+        self.smtp = None
+
+    def connect(self):
+        self.smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            self.smtp.starttls()
+        if self.username:
+            self.smtp.login(self.username, self.password)
+
+    def send(self, message):
+        if self.smtp is None:
+            self.connect()
+        try:
+            self.smtp.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            # Server closed an idle connection: reconnect once and retry
+            self.connect()
+            self.smtp.send_message(message)
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            self.smtp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# -------------------------------------------------
+# DISPATCHER
+# -------------------------------------------------
+def _backoff(attempts, base_seconds):
+    return timedelta(seconds=base_seconds * (2 ** (attempts - 1)))
+
+
+def _build_email(message, sender):
+    email = EmailMessage()
+    email["From"] = sender
+    email["To"] = message.recipient
+    email["Subject"] = message.subject
+    email.set_content(
+        "Your payment receipt is included in this email as HTML. "
+        "Open it in an email client that shows HTML messages."
+    )
+    email.add_alternative(message.body, subtype="html")
+    return email
+
+
+def dispatch_pending(connection, batch_size=50):
+    """
+    Send one batch of due messages. Returns (sent, failed) counts.
+
+    SMTP and network errors are retried with backoff. Any other error
+    (e.g. a bad recipient header) will not go away on retry,
+    so that message is marked Failed and the batch carries on.
+    """
+    config = current_app.config
+    max_attempts = int(config.get("MAIL_MAX_ATTEMPTS", 5))
+    backoff_base = int(config.get("MAIL_BACKOFF_SECONDS", 60))
+    sender = config.get("MAIL_SENDER", "no-reply@localhost")
+    now = datetime.utcnow()
+
+    messages = (
+        EmailOutbox.query
+        .filter(
+            EmailOutbox.status == "Pending",
+            EmailOutbox.next_attempt_at <= now,
+        )
+        .order_by(EmailOutbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+
+    sent = failed = 0
+
+    for message in messages:
+        try:
+            connection.send(_build_email(message, sender))
+        except (smtplib.SMTPException, OSError) as exc:
+            message.attempts += 1
+            message.last_error = str(exc)[:1000]
+            if message.attempts >= max_attempts:
+                message.status = "Failed"
+            else:
+                message.next_attempt_at = now + _backoff(
+                    message.attempts, backoff_base
+                )
+            failed += 1
+        except Exception as exc:
+            current_app.logger.exception(
+                "Outbox message %s cannot be sent", message.id
+            )
+            message.attempts += 1
+            message.last_error = repr(exc)[:1000]
+            message.status = "Failed"
+            failed += 1
+        else:
+            message.attempts += 1
+            message.status = "Sent"
+            message.sent_at = datetime.utcnow()
+            sent += 1
+
+    db.session.commit()
+    return sent, failed
+
+
+# -------------------------------------------------
+# CLI: flask send-receipts
+# -------------------------------------------------
+@click.command("send-receipts")
+@click.option("--batch-size", default=50, show_default=True)
+@click.option("--once", is_flag=True, help="Drain the queue once and exit.")
+@click.option("--interval", default=10, show_default=True,
+              help="Seconds to sleep when the queue is empty.")
+@with_appcontext
+def send_receipts_command(batch_size, once, interval):
+    """Dispatch pending receipt emails from the outbox."""
+    total_sent = total_failed = 0
+    started = time.monotonic()
+
+    with SMTPConnection(current_app.config) as connection:
+        try:
+            while True:
+                sent, failed = dispatch_pending(connection, batch_size)
+                total_sent += sent
+                total_failed += failed
+
+                if sent or failed:
+                    elapsed = time.monotonic() - started
+                    click.echo(
+                        f"sent={total_sent} failed={total_failed} "
+                        f"rate={total_sent / elapsed:.1f} msg/s"
+                    )
+
+                if sent + failed < batch_size:
+                    if once:
+                        break
+                    connection.close()
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    elapsed = time.monotonic() - started
+    click.echo(
+        f"Done: {total_sent} sent, {total_failed} failed "
+        f"in {elapsed:.2f}s"
+    )
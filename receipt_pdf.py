@@ -0,0 +1,269 @@
+"""
+PDF receipts with a content-addressed cache, and streamed ZIP bundles.
+
+receipt.html is rendered as usual, then converted with xhtml2pdf. Totals
+on a receipt are as of that payment (everything paid on the admission up
+to and including it), so a receipt never changes once issued. The PDF is
+cached on disk under the SHA-256 of the rendered HTML, so each receipt is
+only converted once.
+
+Bundles render HTML in the request (templates need the app context) and
+convert each chunk, writing it into a ZIP that is streamed to the client
+as it grows. Conversion runs in the request by default; with
+RECEIPT_PDF_WORKERS > 1 it goes to a process pool, falling back to the
+request when the platform cannot start one (e.g. serverless without
+POSIX semaphores). A receipt that fails to convert becomes a .error.txt
+entry rather than cutting the ZIP short.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from flask import current_app, render_template
+from sqlalchemy import and_, func
+from sqlalchemy.orm import aliased
+
+from models import db, FeePayment
+
+try:
+    from xhtml2pdf import pisa
+except ImportError:  # pragma: no cover - optional dependency
+    pisa = None
+
+
+class PDFUnavailable(RuntimeError):
+    pass
+
+
+def pdf_available():
+    return pisa is not None
+
+
+# -------------------------------------------------
+# RENDERING
+# -------------------------------------------------
+def paid_to_date(payments):
+    """
+    {payment id: amount paid on its admission up to and including it},
+    for a list of payments in one query.
+    """
+    earlier = aliased(FeePayment)
+    rows = (
+        db.session.query(FeePayment.id, func.sum(earlier.amount))
+        .join(earlier, and_(
+            earlier.admission_id == FeePayment.admission_id,
+            earlier.id <= FeePayment.id,
+        ))
+        .filter(FeePayment.id.in_([payment.id for payment in payments]))
+        .group_by(FeePayment.id)
+    )
+    return dict(rows.all())
+
+
+def render_receipt_html(payment, admission, student, paid=None, pdf=True):
+    """receipt.html with payment-time totals; every receipt renders here."""
+    if paid is None:
+        paid = paid_to_date([payment])[payment.id]
+
+    return render_template(
+        "receipt.html",
+        payment=payment,
+        admission=admission,
+        student=student,
+        paid_to_date=paid,
+        pending_after=admission.total_fee - paid,
+        pdf=pdf,
+    )
+
+
+def html_to_pdf(html):
+    """Convert one receipt. Top-level so a process pool can run it."""
+    # Built-in PDF fonts have no rupee glyph
+    html = html.replace("₹", "Rs. ")
+    out = BytesIO()
+    result = pisa.CreatePDF(html, dest=out, encoding="utf-8")
+    if result.err:
+        raise ValueError("Receipt PDF conversion failed")
+    return out.getvalue()
+
+
+# -------------------------------------------------
+# CONTENT-ADDRESSED CACHE
+# -------------------------------------------------
+def _cache_dir():
+    return current_app.config.get("RECEIPT_CACHE_DIR") or os.path.join(
+        tempfile.gettempdir(), "receipt_cache"
+    )
+
+
+def _cache_path(html):
+    key = hashlib.sha256(html.encode("utf-8")).hexdigest()
+    return os.path.join(_cache_dir(), key[:2], key + ".pdf")
+
+
+def _read_cached(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _write_cached(path, pdf):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+
+
+def receipt_pdf(payment, admission, student):
+    """PDF bytes for one receipt, from cache when possible."""
+    if pisa is None:
+        raise PDFUnavailable("xhtml2pdf is not installed")
+
+    html = render_receipt_html(payment, admission, student)
+    path = _cache_path(html)
+
+    pdf = _read_cached(path)
+    if pdf is None:
+        pdf = html_to_pdf(html)
+        _write_cached(path, pdf)
+    return pdf
+
+
+def receipt_filename(payment):
+    return "RCP-%06d.pdf" % payment.id
+
+
+def _start_pool(workers):
+    if workers <= 1:
+        return None
+    try:
+        return ProcessPoolExecutor(workers)
+    except (OSError, ImportError, NotImplementedError):
+        current_app.logger.warning(
+            "Cannot start a PDF process pool, converting in the request"
+        )
+        return None
+
+
+def _convert(executor, htmls):
+    """PDF bytes, or the exception raised, for each html."""
+    if executor is not None:
+        futures = [executor.submit(html_to_pdf, html) for html in htmls]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BrokenProcessPool:
+                raise
+            except Exception as exc:
+                results.append(exc)
+        return results
+
+    results = []
+    for html in htmls:
+        try:
+            results.append(html_to_pdf(html))
+        except Exception as exc:
+            results.append(exc)
+    return results
+
+
+# -------------------------------------------------
+# STREAMED ZIP BUNDLE
+# -------------------------------------------------
+class _ZipStream:
+    """Write-only sink that ZipFile fills and the response drains."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_receipt_zip(payment_chunks, workers=None):
+    """
+    Yield ZIP bytes for every payment in payment_chunks.
+
+    payment_chunks yields lists of FeePayment rows with admission, student
+    and batch already loaded. Cache misses in each chunk are converted
+    together, across the worker pool when there is one.
+    """
+    if pisa is None:
+        raise PDFUnavailable("xhtml2pdf is not installed")
+
+    if workers is None:
+        workers = current_app.config.get("RECEIPT_PDF_WORKERS", 1)
+
+    stream = _ZipStream()
+    executor = _start_pool(workers)
+
+    try:
+        with zipfile.ZipFile(stream, "w", zipfile.ZIP_STORED) as bundle:
+            for payments in payment_chunks:
+                entries = []
+                misses = []
+
+                totals = paid_to_date(payments)
+                for payment in payments:
+                    admission = payment.admission
+                    html = render_receipt_html(
+                        payment, admission, admission.student,
+                        paid=totals[payment.id],
+                    )
+                    path = _cache_path(html)
+                    pdf = _read_cached(path)
+                    entries.append([receipt_filename(payment), path, pdf])
+                    if pdf is None:
+                        misses.append((entries[-1], html))
+
+                htmls = [html for _, html in misses]
+                try:
+                    results = _convert(executor, htmls)
+                except BrokenProcessPool:
+                    current_app.logger.warning(
+                        "PDF process pool broke, converting in the request"
+                    )
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = None
+                    results = _convert(None, htmls)
+
+                for (entry, _), result in zip(misses, results):
+                    if isinstance(result, Exception):
+                        current_app.logger.error(
+                            "Receipt %s failed: %r", entry[0], result
+                        )
+                        entry[0] = entry[0].replace(".pdf", ".error.txt")
+                        entry[2] = (
+                            f"This receipt could not be generated: {result}\n"
+                        ).encode("utf-8")
+                        continue
+                    _write_cached(entry[1], result)
+                    entry[2] = result
+
+                for name, _, pdf in entries:
+                    bundle.writestr(name, pdf)
+
+                yield stream.drain()
+
+        # Central directory
+        yield stream.drain()
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
@@ -1,6 +1,7 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, Response, render_template, request, redirect, url_for
 from flask_login import login_required, current_user
-from datetime import date
+from sqlalchemy.orm import joinedload
+from datetime import date, timedelta
 
 from models import (
     db,
@@ -10,6 +11,15 @@ from models import (
     FeePayment,
     BatchPaymentSource,
     PaymentSource,
+    AdmissionInstallment,
+)
+import audit
+from daily_collections import record_collection
+from dues_aging import refresh_aging
+from installments import allocate_payment, create_installments, due_installments
+from outbox import enqueue_receipt
+from receipt_pdf import (
+    pdf_available, receipt_filename, receipt_pdf, render_receipt_html,
 )
 
 reception_bp = Blueprint("reception", __name__, url_prefix="/reception")
@@ -41,6 +51,7 @@ def dashboard():
         # RELOAD STUDENT CONTEXT (ALWAYS SAFE)
         # -------------------------------------------------
         if student_id:
+            # None for unknown ids and students of other branches
             student = db.session.get(Student, int(student_id))
             if student:
                 admissions = Admission.query.filter_by(
@@ -73,7 +84,9 @@ def dashboard():
         elif action == "new_admission":
 
             # HARD VALIDATION
-            if not request.form.get("batch_id") \
+            if not student:
+                error = "Student not found. Please search again."
+            elif not request.form.get("batch_id") \
                or not request.form.get("paid_amount") \
                or not request.form.get("received_in"):
                 error = "Please fill all required fields."
@@ -84,21 +97,14 @@ def dashboard():
                 remarks = request.form.get("remarks")
 
                 batch = db.session.get(Batch, batch_id)
-                if not batch:
-                    error = "Selected batch no longer exists. Please reload the page."
-                else:
-                    existing_adm = Admission.query.filter_by(
-                        student_id=student.id,
-                        batch_id=batch.id,
-                    ).first()
-
-
-                existing_adm = Admission.query.filter_by(
+                existing_adm = batch and Admission.query.filter_by(
                     student_id=student.id,
                     batch_id=batch.id,
                 ).first()
 
-                if existing_adm:
+                if not batch:
+                    error = "Selected batch no longer exists. Please reload the page."
+                elif existing_adm:
                     error = "Student is already admitted to this batch."
                 else:
                     admission = Admission(
@@ -109,26 +115,50 @@ def dashboard():
                         pending_amount=batch.total_fee - paid_amount,
                         remarks=remarks,
                         admission_date=date.today(),
+                        # The batch's branch, even for head-office staff
+                        branch_id=batch.branch_id,
                         status="Completed"
                         if paid_amount >= batch.total_fee
                         else "Active",
                     )
                     db.session.add(admission)
-                    db.session.commit()
+                    db.session.flush()
+
+                    create_installments(admission)
+                    allocate_payment(admission, paid_amount)
 
                     payment = FeePayment(
                         admission_id=admission.id,
                         amount=paid_amount,
                         received_in=received_in,
+                        branch_id=admission.branch_id,
                     )
                     db.session.add(payment)
+
+                    # Receipt email, rollups and audit ride the same transaction
+                    enqueue_receipt(payment, student)
+                    record_collection(payment, admission)
+                    refresh_aging([admission.id])
+
+                    db.session.flush()
+                    audit.record(
+                        "admission_created", "admission", admission.id,
+                        after=audit.snapshot(admission),
+                        branch_id=admission.branch_id, transactional=True,
+                    )
+                    audit.record(
+                        "payment_recorded", "fee_payment", payment.id,
+                        after=audit.snapshot(payment),
+                        branch_id=admission.branch_id, transactional=True,
+                    )
                     db.session.commit()
 
                     message = "Admission completed successfully."
 
-            admissions = Admission.query.filter_by(
-                student_id=student.id
-            ).all()
+            if student:
+                admissions = Admission.query.filter_by(
+                    student_id=student.id
+                ).all()
 
         # -------------------------------------------------
         # PAY PENDING FEE
@@ -145,13 +175,20 @@ def dashboard():
 
                 admission = db.session.get(Admission, admission_id)
 
-                if paid_amount > admission.pending_amount:
+                if not student or not admission \
+                   or admission.student_id != student.id:
+                    error = "Admission not found. Please search again."
+                elif paid_amount > admission.pending_amount:
                     error = f"Amount exceeds pending fee (₹{admission.pending_amount})"
                 else:
+                    balance_fields = ["paid_amount", "pending_amount", "status"]
+                    before = audit.snapshot(admission, balance_fields)
+
                     payment = FeePayment(
                         admission_id=admission.id,
                         amount=paid_amount,
                         received_in=received_in,
+                        branch_id=admission.branch_id,
                     )
                     db.session.add(payment)
 
@@ -161,12 +198,30 @@ def dashboard():
                     if admission.pending_amount == 0:
                         admission.status = "Completed"
 
+                    allocate_payment(admission, paid_amount)
+                    enqueue_receipt(payment, admission.student)
+                    record_collection(payment, admission)
+                    refresh_aging([admission.id])
+
+                    db.session.flush()
+                    audit.record(
+                        "payment_recorded", "fee_payment", payment.id,
+                        after=audit.snapshot(payment),
+                        branch_id=admission.branch_id, transactional=True,
+                    )
+                    audit.record(
+                        "balance_updated", "admission", admission.id,
+                        before=before,
+                        after=audit.snapshot(admission, balance_fields),
+                        branch_id=admission.branch_id, transactional=True,
+                    )
                     db.session.commit()
                     message = "Payment recorded successfully."
 
-            admissions = Admission.query.filter_by(
-                student_id=student.id
-            ).all()
+            if student:
+                admissions = Admission.query.filter_by(
+                    student_id=student.id
+                ).all()
 
     # -------------------------------------------------
     # LOAD PAYMENT SOURCES
@@ -207,6 +262,41 @@ def dashboard():
     )
 
 
+# -------------------------------------------------
+# DUES: OVERDUE / DUE THIS WEEK
+# -------------------------------------------------
+@reception_bp.route("/dues")
+@login_required
+def dues():
+    if current_user.role not in ["reception", "admin"]:
+        return "Access Denied", 403
+
+    today = date.today()
+    week_end = today + timedelta(days=6 - today.weekday())
+
+    # Single range scan on (is_settled, due_date)
+    installments = due_installments(
+        week_end,
+        options=[
+            joinedload(AdmissionInstallment.admission)
+            .joinedload(Admission.student),
+            joinedload(AdmissionInstallment.admission)
+            .joinedload(Admission.batch),
+        ],
+    )
+
+    overdue = [i for i in installments if i.due_date < today]
+    due_this_week = [i for i in installments if i.due_date >= today]
+
+    return render_template(
+        "reception_dues.html",
+        today=today,
+        week_end=week_end,
+        overdue=overdue,
+        due_this_week=due_this_week,
+    )
+
+
 # -------------------------------------------------
 # RECEIPT VIEW (RECEPTION)
 # -------------------------------------------------
@@ -221,11 +311,21 @@ def view_receipt(payment_id):
         return "Receipt not found", 404
 
     admission = db.session.get(Admission, payment.admission_id)
-    student = db.session.get(Student, admission.student_id)
+    student = admission and db.session.get(Student, admission.student_id)
+    if not student:
+        return "Receipt not found", 404
 
-    return render_template(
-        "receipt.html",
-        payment=payment,
-        admission=admission,
-        student=student,
-    )
+    if request.args.get("format") == "pdf":
+        if not pdf_available():
+            return "PDF receipts are not available", 501
+
+        return Response(
+            receipt_pdf(payment, admission, student),
+            mimetype="application/pdf",
+            headers={
+                "Content-Disposition":
+                f"inline; filename={receipt_filename(payment)}"
+            },
+        )
+
+    return render_receipt_html(payment, admission, student, pdf=False)
@@ -0,0 +1,275 @@
+"""
+Bank / UPI statement reconciliation.
+
+An uploaded statement CSV is matched against FeePayment rows received in
+the chosen payment sources. Both sides are loaded into numpy arrays and
+matched on amount and date, within a tolerance of a few days:
+
+* each row gets the key `amount * span + day`, where span is wider than
+  the date range, so one sorted array orders by amount and then date and
+  "same amount, within N days" is a contiguous key range;
+* np.searchsorted finds that range for every statement line at once, and
+  the same trick the other way round counts lines per payment.
+
+A line with exactly one candidate payment, which has no other candidate
+line, is Matched and linked in reconciliation_matches. Lines with no
+candidates are Unmatched; the rest are Ambiguous and left for a person.
+Payments already linked by an earlier statement are not matched again.
+"""
+import csv
+import io
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+import numpy as np
+
+from models import db, FeePayment, ReconciliationMatch, StatementLine
+
+MATCHED = "Matched"
+UNMATCHED = "Unmatched"
+AMBIGUOUS = "Ambiguous"
+
+DATE_COLUMNS = ("date", "txn date", "transaction date", "value date")
+AMOUNT_COLUMNS = ("credit", "deposit", "amount")
+REFERENCE_COLUMNS = ("reference", "ref no", "utr", "transaction id")
+DESCRIPTION_COLUMNS = ("description", "narration", "remarks")
+
+DATE_FORMATS = ("%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d-%b-%Y", "%d %b %Y")
+
+INSERT_CHUNK = 1000
+
+# Wider windows make nearly every line ambiguous anyway
+MAX_TOLERANCE_DAYS = 30
+
+
+class StatementError(ValueError):
+    pass
+
+
+# -------------------------------------------------
+# CSV PARSING
+# -------------------------------------------------
+def _find_column(headers, names):
+    for name in names:
+        if name in headers:
+            return headers[name]
+    return None
+
+
+def _parse_date(text):
+    text = (text or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _parse_amount(text):
+    text = (text or "").replace(",", "").replace("₹", "").strip()
+    if not text:
+        return None
+    try:
+        # Fees are whole rupees
+        return int(Decimal(text).quantize(Decimal("1"), ROUND_HALF_UP))
+    except InvalidOperation:
+        return None
+
+
+def read_statement(stream):
+    """
+    Credit lines from a statement CSV, as a list of dicts.
+
+    Needs a date column and a credit/amount column; reference and
+    description are kept when present. Debits and blank amounts are
+    skipped.
+    """
+    reader = csv.reader(io.TextIOWrapper(stream, encoding="utf-8-sig"))
+    header = next(reader, None)
+    if not header:
+        raise StatementError("The statement file is empty.")
+
+    headers = {name.strip().lower(): i for i, name in enumerate(header)}
+    date_col = _find_column(headers, DATE_COLUMNS)
+    amount_col = _find_column(headers, AMOUNT_COLUMNS)
+    reference_col = _find_column(headers, REFERENCE_COLUMNS)
+    description_col = _find_column(headers, DESCRIPTION_COLUMNS)
+
+    if date_col is None or amount_col is None:
+        raise StatementError(
+            "The statement needs a Date column and a Credit or Amount column."
+        )
+
+    def cell(row, col):
+        return row[col] if col is not None and col < len(row) else ""
+
+    lines = []
+    for line_no, row in enumerate(reader, start=2):
+        if not any(row):
+            continue
+
+        amount = _parse_amount(cell(row, amount_col))
+        if not amount or amount <= 0:
+            continue
+
+        txn_date = _parse_date(cell(row, date_col))
+        if txn_date is None:
+            raise StatementError(
+                f"Line {line_no}: unrecognised date '{cell(row, date_col)}'."
+            )
+
+        lines.append({
+            "line_no": line_no,
+            "txn_date": txn_date,
+            "amount": amount,
+            "reference": cell(row, reference_col).strip()[:100],
+            "description": cell(row, description_col).strip()[:200],
+        })
+
+    return lines
+
+
+# -------------------------------------------------
+# VECTORIZED MATCHING
+# -------------------------------------------------
+def _days(dates):
+    return np.array(dates, dtype="datetime64[D]").astype(np.int64)
+
+
+def match_arrays(line_days, line_amounts, pay_days, pay_amounts, tolerance):
+    """
+    Match statement lines to payments.
+
+    Returns (candidates, payment_index, matched): candidate payments per
+    line, the payment index for lines with exactly one candidate (-1
+    otherwise), and a mask of one-to-one matches.
+    """
+    n_lines = len(line_days)
+    candidates = np.zeros(n_lines, dtype=np.int64)
+    payment_index = np.full(n_lines, -1, dtype=np.int64)
+
+    if n_lines == 0 or len(pay_days) == 0:
+        return candidates, payment_index, np.zeros(n_lines, dtype=bool)
+
+    # Day offsets stay in [tolerance, span - tolerance), so a ±tolerance
+    # window never crosses into the next amount
+    origin = min(line_days.min(), pay_days.min()) - tolerance
+    span = max(line_days.max(), pay_days.max()) - origin + tolerance + 1
+
+    line_keys = line_amounts * span + (line_days - origin)
+    pay_keys = pay_amounts * span + (pay_days - origin)
+
+    order = np.argsort(pay_keys, kind="stable")
+    sorted_pay = pay_keys[order]
+    lo = np.searchsorted(sorted_pay, line_keys - tolerance, "left")
+    hi = np.searchsorted(sorted_pay, line_keys + tolerance, "right")
+    candidates = hi - lo
+
+    sorted_lines = np.sort(line_keys)
+    lines_per_payment = (
+        np.searchsorted(sorted_lines, pay_keys + tolerance, "right")
+        - np.searchsorted(sorted_lines, pay_keys - tolerance, "left")
+    )
+
+    single = candidates == 1
+    payment_index[single] = order[lo[single]]
+
+    matched = single.copy()
+    matched[single] = lines_per_payment[payment_index[single]] == 1
+
+    return candidates, payment_index, matched
+
+
+# -------------------------------------------------
+# RECONCILE AN UPLOAD
+# -------------------------------------------------
+def reconcile(upload, lines):
+    """
+    Match `lines` (from read_statement) for a flushed StatementUpload and
+    store lines, match links and counts. Caller commits.
+    """
+    if not lines:
+        raise StatementError("The statement has no credit lines.")
+
+    tolerance = upload.tolerance_days
+    window = timedelta(days=tolerance)
+    line_days = _days([line["txn_date"] for line in lines])
+    line_amounts = np.array([line["amount"] for line in lines], dtype=np.int64)
+
+    upload.start_date = min(line["txn_date"] for line in lines)
+    upload.end_date = max(line["txn_date"] for line in lines)
+
+    already_matched = db.session.query(ReconciliationMatch.fee_payment_id)
+    payments = (
+        db.session.query(
+            FeePayment.id, FeePayment.payment_date, FeePayment.amount
+        )
+        .filter(
+            FeePayment.received_in.in_(
+                [str(ps_id) for ps_id in upload.source_ids()]
+            ),
+            FeePayment.payment_date.between(
+                upload.start_date - window,
+                upload.end_date + window,
+            ),
+            FeePayment.id.notin_(already_matched),
+        )
+        .all()
+    )
+
+    pay_ids = np.array([p.id for p in payments], dtype=np.int64)
+    pay_days = _days([p.payment_date for p in payments])
+    pay_amounts = np.array([p.amount for p in payments], dtype=np.int64)
+
+    candidates, payment_index, matched = match_arrays(
+        line_days, line_amounts, pay_days, pay_amounts, tolerance
+    )
+
+    statuses = np.where(
+        matched, MATCHED, np.where(candidates == 0, UNMATCHED, AMBIGUOUS)
+    )
+
+    rows = [
+        {
+            **line,
+            "upload_id": upload.id,
+            "status": str(status),
+            "candidate_count": int(count),
+        }
+        for line, status, count in zip(lines, statuses, candidates)
+    ]
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.session.execute(
+            StatementLine.__table__.insert(), rows[start:start + INSERT_CHUNK]
+        )
+
+    line_ids = dict(
+        db.session.query(StatementLine.line_no, StatementLine.id)
+        .filter(StatementLine.upload_id == upload.id)
+        .all()
+    )
+
+    hits = np.flatnonzero(matched)
+    links = [
+        {
+            "upload_id": upload.id,
+            "statement_line_id": line_ids[lines[i]["line_no"]],
+            "fee_payment_id": int(pay_ids[payment_index[i]]),
+            "day_difference": int(
+                line_days[i] - pay_days[payment_index[i]]
+            ),
+            "created_at": datetime.utcnow(),
+        }
+        for i in hits
+    ]
+    for start in range(0, len(links), INSERT_CHUNK):
+        db.session.execute(
+            ReconciliationMatch.__table__.insert(),
+            links[start:start + INSERT_CHUNK],
+        )
+
+    upload.line_count = len(lines)
+    upload.matched_count = len(links)
+    upload.unmatched_count = int((statuses == UNMATCHED).sum())
+    upload.ambiguous_count = int((statuses == AMBIGUOUS).sum())
@@ -1,29 +1,85 @@
-from flask import Blueprint, render_template
+import click
+from flask import Blueprint, Response, render_template, request
+from flask.cli import with_appcontext
 from flask_login import login_required, current_user
+from sqlalchemy import exists, func
+from sqlalchemy.orm import contains_eager, joinedload
 
-from models import Student, Admission, FeePayment
+from models import db, Student, Admission, FeePayment, User
+from receipt_pdf import (
+    pdf_available, receipt_filename, receipt_pdf, render_receipt_html,
+)
 
 student_bp = Blueprint("student", __name__, url_prefix="/student")
 
 
+# -------------------------------------------------
+# PORTAL LOADERS
+# -------------------------------------------------
+def portal_student_id(user):
+    """Student linked to this login; links by email once if missing."""
+    if user.student_id is None:
+        student = Student.query.filter_by(email=user.email).first()
+        if not student:
+            return None
+        user.student_id = student.id
+        db.session.commit()
+    return user.student_id
+
+
+def load_portal_student(student_id):
+    """
+    Student with admissions, batches and payments in two queries:
+    student + admissions + batch joined, then payments by admission id.
+    """
+    return (
+        Student.query
+        .filter(Student.id == student_id)
+        .options(
+            joinedload(Student.admissions).joinedload(Admission.batch),
+            joinedload(Student.admissions).selectinload(Admission.payments),
+        )
+        .first()
+    )
+
+
+def load_portal_receipt(student_id, payment_id):
+    """Payment with its admission, batch and student in one query."""
+    return (
+        FeePayment.query
+        .join(FeePayment.admission)
+        .join(Admission.student)
+        .join(Admission.batch)
+        .options(
+            contains_eager(FeePayment.admission)
+            .contains_eager(Admission.student),
+            contains_eager(FeePayment.admission)
+            .contains_eager(Admission.batch),
+        )
+        .filter(
+            FeePayment.id == payment_id,
+            Admission.student_id == student_id,
+        )
+        .first()
+    )
+
+
 @student_bp.route("/dashboard")
 @login_required
 def dashboard():
     if current_user.role != "student":
         return "Access Denied", 403
 
-    # 🔒 FIX: Match student correctly
-    student = Student.query.filter_by(email=current_user.email).first()
+    student_id = portal_student_id(current_user)
+    student = load_portal_student(student_id) if student_id else None
 
     if not student:
         return "Student profile not found", 404
 
-    admissions = Admission.query.filter_by(student_id=student.id).all()
-
     return render_template(
         "student_dashboard.html",
         student=student,
-        admissions=admissions
+        admissions=student.admissions
     )
 
 
@@ -33,17 +89,53 @@ def view_receipt(payment_id):
     if current_user.role != "student":
         return "Access Denied", 403
 
-    payment = FeePayment.query.get_or_404(payment_id)
-    admission = Admission.query.get(payment.admission_id)
+    student_id = portal_student_id(current_user)
+    payment = (
+        load_portal_receipt(student_id, payment_id) if student_id else None
+    )
 
-    student = Student.query.filter_by(email=current_user.email).first()
+    # Missing and not-yours look the same to the student
+    if not payment:
+        return "Receipt not found", 404
 
-    if not student or admission.student_id != student.id:
-        return "Access Denied", 403
+    admission = payment.admission
+    student = admission.student
 
-    return render_template(
-        "receipt.html",
-        payment=payment,
-        admission=admission,
-        student=student
+    if request.args.get("format") == "pdf":
+        if not pdf_available():
+            return "PDF receipts are not available", 501
+
+        return Response(
+            receipt_pdf(payment, admission, student),
+            mimetype="application/pdf",
+            headers={
+                "Content-Disposition":
+                f"inline; filename={receipt_filename(payment)}"
+            },
+        )
+
+    return render_receipt_html(payment, admission, student, pdf=False)
+
+
+# -------------------------------------------------
+# CLI: flask link-student-users
+# -------------------------------------------------
+@click.command("link-student-users")
+@with_appcontext
+def link_student_users_command():
+    """Backfill user.student_id from matching student emails."""
+    matching_student = (
+        db.session.query(func.min(Student.id))
+        .filter(Student.email == User.email)
+        .scalar_subquery()
+    )
+
+    count = User.query.filter(
+        User.role == "student",
+        User.student_id.is_(None),
+        exists().where(Student.email == User.email),
+    ).update(
+        {User.student_id: matching_student}, synchronize_session=False
     )
+    db.session.commit()
+    click.echo(f"Linked {count} student logins")
@@ -0,0 +1,123 @@
+import numpy as np
+
+from reconciliation import match_arrays
+
+
+def run(lines, payments, tolerance):
+    """lines / payments are lists of (day, amount)."""
+    line_days, line_amounts = (np.array(c, dtype=np.int64) for c in zip(*lines))
+    if payments:
+        pay_days, pay_amounts = (
+            np.array(c, dtype=np.int64) for c in zip(*payments)
+        )
+    else:
+        pay_days = pay_amounts = np.array([], dtype=np.int64)
+    return match_arrays(line_days, line_amounts, pay_days, pay_amounts, tolerance)
+
+
+def test_one_to_one_within_tolerance():
+    candidates, payment_index, matched = run(
+        lines=[(100, 500), (105, 700), (110, 900)],
+        payments=[(109, 900), (99, 500), (103, 700)],
+        tolerance=2,
+    )
+
+    assert candidates.tolist() == [1, 1, 1]
+    assert matched.tolist() == [True, True, True]
+    assert payment_index.tolist() == [1, 2, 0]
+
+
+def test_same_amount_other_day_outside_tolerance_is_unmatched():
+    candidates, payment_index, matched = run(
+        lines=[(100, 500)],
+        payments=[(103, 500), (100, 501)],
+        tolerance=2,
+    )
+
+    assert candidates.tolist() == [0]
+    assert payment_index.tolist() == [-1]
+    assert not matched.any()
+
+
+def test_duplicate_amounts_on_same_day_are_ambiguous():
+    candidates, payment_index, matched = run(
+        lines=[(100, 700), (100, 700)],
+        payments=[(100, 700), (100, 700)],
+        tolerance=0,
+    )
+
+    assert candidates.tolist() == [2, 2]
+    assert not matched.any()
+
+
+def test_two_lines_sharing_one_payment_are_not_matched():
+    candidates, payment_index, matched = run(
+        lines=[(100, 1100), (101, 1100)],
+        payments=[(100, 1100)],
+        tolerance=1,
+    )
+
+    # Each line sees exactly one payment, but the payment sees both lines
+    assert candidates.tolist() == [1, 1]
+    assert payment_index.tolist() == [0, 0]
+    assert not matched.any()
+
+
+def test_chained_windows():
+    # line(100) - pay(102) - line(104) - pay(106): every window overlaps a
+    # neighbour, so only the ends have one candidate and none is one-to-one
+    candidates, payment_index, matched = run(
+        lines=[(100, 300), (104, 300)],
+        payments=[(102, 300), (106, 300)],
+        tolerance=2,
+    )
+
+    assert candidates.tolist() == [1, 2]
+    assert payment_index.tolist() == [0, -1]
+    assert not matched.any()
+
+
+def test_chain_broken_by_tolerance_matches_pairs():
+    candidates, payment_index, matched = run(
+        lines=[(100, 300), (104, 300)],
+        payments=[(101, 300), (105, 300)],
+        tolerance=1,
+    )
+
+    assert candidates.tolist() == [1, 1]
+    assert payment_index.tolist() == [0, 1]
+    assert matched.tolist() == [True, True]
+
+
+def test_zero_tolerance_needs_exact_day():
+    candidates, payment_index, matched = run(
+        lines=[(100, 500), (101, 600)],
+        payments=[(100, 500), (102, 600)],
+        tolerance=0,
+    )
+
+    assert candidates.tolist() == [1, 0]
+    assert matched.tolist() == [True, False]
+    assert payment_index.tolist() == [0, -1]
+
+
+def test_window_never_crosses_into_next_amount():
+    # Latest day of amount 499 and earliest of 500 are adjacent keys
+    candidates, _, matched = run(
+        lines=[(200, 499), (100, 500)],
+        payments=[(100, 500), (200, 499)],
+        tolerance=5,
+    )
+
+    assert candidates.tolist() == [1, 1]
+    assert matched.tolist() == [True, True]
+
+
+def test_no_payments():
+    candidates, payment_index, matched = run(
+        lines=[(100, 500)], payments=[], tolerance=2
+    )
+
+    assert candidates.tolist() == [0]
+    assert payment_index.tolist() == [-1]
+    assert not matched.any()